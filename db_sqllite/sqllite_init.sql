@@ -16,9 +16,77 @@ CREATE TABLE IF NOT EXISTS commits (
     date TEXT,
     message TEXT,
     files TEXT,
-    diffs TEXT
+    diffs TEXT,
+    diffs_text TEXT    -- the diffs of all the files as plain text, indexed by commits_fts
 );
 
+-- indexes for the lookups done by the NL→SQL tool (hash prefixes, date ranges, authors)
+-- LIKE is case-insensitive, so the NOCASE indexes are the ones usable by `LIKE 'prefix%'`
+CREATE INDEX IF NOT EXISTS idx_commits_hash_nocase ON commits (commit_hash COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_commits_date ON commits (date);
+CREATE INDEX IF NOT EXISTS idx_commits_author ON commits (author COLLATE NOCASE);
+
+-- plain-text view of the commits indexed by commits_fts: `diffs` holds JSON-encoded text (tabs as `\t`),
+-- so the decoded `diffs_text` column is indexed instead, under the name `diffs`
+CREATE VIEW IF NOT EXISTS commits_fts_content AS
+SELECT id, message, files, diffs_text AS diffs
+FROM commits;
+
+-- full-text index over message, files and diffs of the commits (rowid = commits.id)
+-- the commits saved before its creation are indexed by `upgrade_schema` (utils/sqlite_utils.py)
+CREATE VIRTUAL TABLE IF NOT EXISTS commits_fts USING fts5 (
+    message,
+    files,
+    diffs,
+    content='commits_fts_content',
+    content_rowid='id',
+    tokenize="unicode61 tokenchars '_'"    -- keep C identifiers like js_pushstring as a single token
+);
+
+-- triggers to keep commits_fts in sync with commits
+CREATE TRIGGER IF NOT EXISTS commits_fts_insert AFTER INSERT ON commits BEGIN
+    INSERT INTO commits_fts (rowid, message, files, diffs) VALUES (new.id, new.message, new.files, new.diffs_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS commits_fts_delete AFTER DELETE ON commits BEGIN
+    INSERT INTO commits_fts (commits_fts, rowid, message, files, diffs) VALUES ('delete', old.id, old.message, old.files, old.diffs_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS commits_fts_update AFTER UPDATE ON commits BEGIN
+    INSERT INTO commits_fts (commits_fts, rowid, message, files, diffs) VALUES ('delete', old.id, old.message, old.files, old.diffs_text);
+    INSERT INTO commits_fts (rowid, message, files, diffs) VALUES (new.id, new.message, new.files, new.diffs_text);
+END;
+
+-- commit_files table to store the files changed by each commit, one row per file
+CREATE TABLE IF NOT EXISTS commit_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    commit_id INTEGER,
+    path TEXT,
+    lines_added INTEGER,
+    lines_removed INTEGER,
+    diff_text TEXT,
+
+    FOREIGN KEY (commit_id) REFERENCES commits(id)
+);
+
+-- default (BINARY) collation, the one of the `commit_files.path = 'jsarray.c'` lookups of the NL→SQL tool
+CREATE INDEX IF NOT EXISTS idx_commit_files_path ON commit_files (path);
+CREATE INDEX IF NOT EXISTS idx_commit_files_commit_id ON commit_files (commit_id);
+
+-- symbols table to store the functions, structs, typedefs and macros of the MuJS sources, rebuilt with the code index
+CREATE TABLE IF NOT EXISTS symbols (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    kind TEXT,
+    file_path TEXT,
+    start_line INTEGER,
+    end_line INTEGER,
+    signature TEXT,
+    code TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_symbols_name ON symbols (name);
+
 -- summaries table to store summaries related to commits for a specific experiment
 CREATE TABLE IF NOT EXISTS summaries (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -34,6 +102,7 @@ CREATE TABLE IF NOT EXISTS summaries (
     llama_tech_summary_retrieved_docs TEXT,
     llama_tech_summary_retrieved_docs_count INTEGER,
     llama_tech_summary_retrieved_docs_scores TEXT,
+    llama_tech_summary_stats TEXT,    -- JSON stats of the technical QA loop (iterations, tokens, seconds, best mark, stop reason)
     
     FOREIGN KEY (commit_id) REFERENCES commits(id)
 )
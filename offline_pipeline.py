@@ -1,9 +1,11 @@
+import collections
 import concurrent.futures
 import copy
 import datetime
 import logging
 import os
 import subprocess
+import time
 
 import ollama
 import torch
@@ -13,16 +15,22 @@ from tqdm import tqdm
 from summary_categorization.categorization import categorize
 from summary_categorization.general_summarization import generate_general_summary
 from summary_categorization.technical_summarization import generate_technical_summary
-from utils.chromadb_utils import save_commit_to_chromadb, delete_all_documents, save_general_document_to_chromadb
-from utils.commit_utils import filter_trivial_commits, normalize_commit_data
+from utils.chromadb_utils import save_commit_to_chromadb, delete_all_documents, save_general_document_to_chromadb, \
+    flush_commits_to_chromadb, embed_retrieval_query
+from utils.commit_utils import iter_filter_trivial_commits, iter_normalize_commit_data
+from utils.embedding_cache import get_embeddings
 from utils.config import SQL_PERSIST_DIR, MUJS_REMOTE_URL, MUJS_LOCAL_PATH, OLLAMA_CLIENT_HOST, SEED, \
-    OFFLINE_MODEL_NAME, OFFLINE_PIPELINE_TEST_NAME
+    OFFLINE_MODEL_NAME, OFFLINE_PIPELINE_TEST_NAME, INCREMENTAL_MODE, MUJS_BRANCH, OLLAMA_NUM_PARALLEL, \
+    OFFLINE_COMMITS_IN_FLIGHT, INCREMENTAL_GIT_PULL, CHROMA_BATCH_SIZE, CHROMA_FLUSH_INTERVAL
 from utils.enums import SummaryType
-from utils.file_utils import load_commits, save_commits, full_path
-from utils.git_utils import extract_git_commits, extract_mujs_docs
-from utils.logging_handler import SQLiteHandler
+from utils.file_utils import load_commits, save_commits, full_path, checkpoint_path, append_commit_checkpoint, \
+    load_commits_checkpoint
+from utils.git_utils import stream_git_commits, extract_mujs_docs
+from utils.llm_utils import BoundedOllamaClient
+from utils.logging_handler import AsyncSQLiteHandler
 from utils.semantic_code_utils import build_mujs_code_index
-from utils.sqlite_utils import save_commits_to_sqlite, save_summaries_to_sqlite, delete_all_summaries
+from utils.sqlite_utils import save_commits_to_sqlite, save_summaries_to_sqlite, delete_all_summaries, \
+    retrieve_last_summarized_commit, retrieve_commit_ids, backfill_commit_files, upgrade_schema, count_commits
 
 torch.manual_seed(SEED)
 
@@ -31,91 +39,248 @@ current_directory = os.getcwd()
 logger = logging.getLogger("DBLogger")
 logger.setLevel(logging.DEBUG)
 
-db_handler = SQLiteHandler(SQL_PERSIST_DIR)
+db_handler = AsyncSQLiteHandler(SQL_PERSIST_DIR)
 
 formatter = logging.Formatter('%(message)s')
 db_handler.setFormatter(formatter)
 
 logger.addHandler(db_handler)
 
-def main():
+def extract_new_commits(local_path, pull=INCREMENTAL_GIT_PULL):
+    """
+    Extracts the commits made after the newest one already summarized, and saves them to SQLite.
+    The commits saved but not summarized by a previous run (e.g. after a crash) are extracted again.
+    The returned commits are indexed so that `idx + 1` matches their id in the `commits` table.
+
+    Args:
+        local_path (str): Path of the local MuJS repository.
+        pull (bool): Whether to fast-forward the local repository first (otherwise it must be updated beforehand).
+
+    Returns:
+        dict | None: The new commits, or None if there are no summaries yet (a full run is needed).
+    """
+    last_commit = retrieve_last_summarized_commit()
+    if last_commit is None:
+        return None
+
+    _, last_hash = last_commit
+    if pull:
+        subprocess.run(["git", "-C", local_path, "pull", "--ff-only"], check=True)
+
+    commits = stream_git_commits(local_path, f"{last_hash}..{MUJS_BRANCH}")
+    commits = iter_filter_trivial_commits(commits)
+    commits = list(iter_normalize_commit_data(commits))
+
+    # the commits already saved are ignored, and the ids are read back since AUTOINCREMENT ids can have gaps
+    save_commits_to_sqlite(dict(enumerate(commits)))
+    ids = retrieve_commit_ids([commit['hash'] for commit in commits])
+    commits = {ids[commit['hash']] - 1: commit for commit in commits}
+
+    print(f"Found {len(commits)} new commits after {last_hash}")
+    return commits
+
+
+def process_commit(commit, idx, llama_model, ollama_client, executor, max_retrieved_index=None) \
+        -> tuple[list[tuple[Document, float]], list[tuple[Document, float]]]:
+    """
+    Categorizes and summarizes a commit, running the three LLM tasks concurrently.
+    Only the tasks whose result is missing from the commit are run.
+
+    Args:
+        commit (dict): The commit data, updated in place with the category and the summaries.
+        idx (int): The id of the commit in the SQLite `commits` table.
+        llama_model (str): The name of the LLM model to use.
+        ollama_client: The Ollama client instance.
+        executor (concurrent.futures.ThreadPoolExecutor): The pool running the LLM tasks, shared by the commits.
+        max_retrieved_index (int, optional): The newest commit that the summaries can retrieve as similar commit.
+
+    Returns:
+        tuple: The documents retrieved for the general summary and for the technical summary.
+    """
+    # the retrieval query is embedded once and shared by both summaries
+    query_embedding = embed_retrieval_query(commit) \
+        if not commit['llama_summary'] or not commit['llama_tech_summary'] else None
+
+    category_future = executor.submit(categorize, commit, idx, llama_model, ollama_client) \
+        if not commit['llama_category'] else None
+    summary_future = executor.submit(generate_general_summary, commit, idx, llama_model, ollama_client,
+                                     query_embedding, max_retrieved_index) \
+        if not commit['llama_summary'] else None
+    tech_summary_future = executor.submit(generate_technical_summary, commit, idx, llama_model, ollama_client,
+                                          query_embedding, max_retrieved_index) \
+        if not commit['llama_tech_summary'] else None
+
+    if category_future is not None:
+        category_future.result()
+    summary_retrieved_docs = summary_future.result() if summary_future is not None else []
+    tech_summary_retrieved_docs = tech_summary_future.result() if tech_summary_future is not None else []
+
+    return summary_retrieved_docs, tech_summary_retrieved_docs
+
+
+def save_processed_commit(idx, commit, future):
+    """
+    Waits for a commit to be processed and buffers its summaries for ChromaDB.
+    The commit is recorded as processed later, by `record_processed_commits`.
+
+    Args:
+        idx (int): The index of the commit.
+        commit (dict): The processed commit.
+        future (concurrent.futures.Future): The future returned by `process_commit`.
+
+    Returns:
+        tuple: The index, the commit and the documents retrieved for its summaries.
+    """
+    summary_retrieved_docs, tech_summary_retrieved_docs = future.result()
+
+    save_commit_to_chromadb(commit, idx + 1, SummaryType.GENERAL)
+    save_commit_to_chromadb(commit, idx + 1, SummaryType.TECHNICAL)
+    return idx, commit, summary_retrieved_docs, tech_summary_retrieved_docs
+
+
+def record_processed_commits(checkpoint_file, processed):
+    """
+    Records a batch of processed commits: their buffered summaries are written to ChromaDB first, then their
+    summaries and categories to SQLite and the checkpoint. A commit recorded as processed is skipped by a resumed
+    or incremental run, so it must never miss its embeddings, even if the run is killed.
+
+    Args:
+        checkpoint_file (str): The path of the checkpoint file.
+        processed (list[tuple]): The commits returned by `save_processed_commit`, in order.
+    """
+    flush_commits_to_chromadb()
+
+    for idx, commit, summary_retrieved_docs, tech_summary_retrieved_docs in processed:
+        save_summaries_to_sqlite(idx + 1, OFFLINE_PIPELINE_TEST_NAME, datetime.datetime.now(),
+                                 commit['llama_category'],
+                                 commit['llama_summary'], summary_retrieved_docs,
+                                 commit['llama_tech_summary'], tech_summary_retrieved_docs,
+                                 commit.get('llama_tech_summary_stats'))
+
+    for idx, commit, _, _ in processed:
+        append_commit_checkpoint(idx, commit, checkpoint_file)
+
+
+def main(incremental=INCREMENTAL_MODE):
     remote_path = MUJS_REMOTE_URL
     local_path = MUJS_LOCAL_PATH
-    ollama_client = ollama.Client(host=OLLAMA_CLIENT_HOST)
+    ollama_client = BoundedOllamaClient(ollama.Client(host=OLLAMA_CLIENT_HOST), OLLAMA_NUM_PARALLEL)
     llama_model = OFFLINE_MODEL_NAME
 
     # Avoid warning related to parallelization
     os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+    upgrade_schema()
+
     if not os.path.isdir(local_path):
       subprocess.run(["git", "clone", remote_path, local_path], check=True) #!git clone {remote_path}
 
     data_filepath_raw_data = 'commits_raw.pkl'          # raw data file with all commits
-    data_filepath_few_shots = 'commits_few_shots.pkl'   # few-shots data file
     commits_folder = 'commits'
+    checkpoint_name = "few_shots"
+
+    # Incremental mode: process only the commits after the last one saved, keeping existing summaries and vectors
+    commits_few_shots = extract_new_commits(local_path) if incremental else None
 
-    # To resume experiments
-    commits = load_commits(commits_folder + '/' + data_filepath_raw_data)
-    commits_few_shots = load_commits(data_filepath_few_shots)
+    if commits_few_shots is not None:
+        checkpoint_name = "incremental"
+        if not commits_few_shots:
+            logger.debug("No new commits to process.")
+            return
 
-    if commits is None: # If there are no checkpoints, initialize commits extraction
-        commits = extract_git_commits(local_path)     # Extract commits from repository
-        commits = filter_trivial_commits(commits)     # Filter trivial commits
-        commits = normalize_commit_data(commits)      # Normalize commits
-        commits = {i: value for i, value in enumerate(commits.values())} # Adjust idxs
+        # Resume the commits processed by an interrupted incremental run (the indexes are the SQLite ids)
+        commits_few_shots = load_commits_checkpoint(commits_few_shots,
+                                                    checkpoint_path(current_directory + '/' + commits_folder, checkpoint_name))
 
-        save_commits(commits, full_path(current_directory + '/' + commits_folder, "raw"))
-        save_commits_to_sqlite(commits)
+        # the code index reflects the current master branch, so it must follow the new commits
+        build_mujs_code_index()
+    else:
+        # To resume experiments
+        commits = load_commits(commits_folder + '/' + data_filepath_raw_data)
 
-    if commits_few_shots is None:
-        commits_few_shots = copy.deepcopy(commits)
+        # the commits added by incremental runs are not in the raw data: extract them all again
+        if commits is not None and count_commits() > len(commits):
+            print("The raw commits are older than the SQLite database, extracting them again")
+            commits = None
 
-    delete_all_summaries()
-    delete_all_documents()
+        if commits is None: # If there are no checkpoints, initialize commits extraction
+            # Stream commits from the repository, filtering and normalizing them lazily (one commit at a time)
+            commits = stream_git_commits(local_path)          # Extract commits from repository
+            commits = iter_filter_trivial_commits(commits)    # Filter trivial commits
+            commits = iter_normalize_commit_data(commits)     # Normalize commits
+            commits = {i: value for i, value in enumerate(commits)} # Adjust idxs
 
-    # process general documents
-    general_docs: list[dict]  = extract_mujs_docs()
-    for i, doc in enumerate(general_docs):
-        save_general_document_to_chromadb({i: doc})
+            save_commits(commits, full_path(current_directory + '/' + commits_folder, "raw"))
+            save_commits_to_sqlite(commits)
 
-    # process code documents
-    build_mujs_code_index()
+            # A checkpoint of a previous extraction doesn't match the new indexes
+            stale_checkpoint = checkpoint_path(current_directory + '/' + commits_folder, checkpoint_name)
+            if os.path.exists(stale_checkpoint):
+                os.remove(stale_checkpoint)
+        else:
+            # commits saved before the creation of the commit_files table
+            backfill_commit_files()
+
+        # Resume the already processed commits from the checkpoint
+        commits_few_shots = load_commits_checkpoint(copy.deepcopy(commits),
+                                                    checkpoint_path(current_directory + '/' + commits_folder, checkpoint_name))
+
+        delete_all_summaries()
+        delete_all_documents()
+
+        # process general documents
+        general_docs: list[dict] = extract_mujs_docs()
+        save_general_document_to_chromadb(dict(enumerate(general_docs)))
+
+        # process code documents
+        build_mujs_code_index()
 
     # process commits
-    for i, (idx, commit) in tqdm(enumerate(commits_few_shots.items())):
-        idx_plus_one = idx + 1
-        # Initialize fields if not present
-        summary_retrieved_docs: list[tuple[Document, float]] = []
-        tech_summary_retrieved_docs: list[tuple[Document, float]] = []
-
-        # Run summarization and classification only on unprocessed commits
-        # Categorization
-        if not commit['llama_category']:
-            categorize(commit, idx_plus_one, llama_model, ollama_client)
-
-        # General summary
-        if not commit['llama_summary']:
-            summary_retrieved_docs = generate_general_summary(commit, idx_plus_one, llama_model, ollama_client)
-
-        # Technical summary
-        if not commit['llama_tech_summary']:
-            tech_summary_retrieved_docs = generate_technical_summary(commit, idx_plus_one, llama_model, ollama_client)
-
-        # save summaries and categories
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(save_commits, commits_few_shots,
-                                full_path(current_directory + '/' + commits_folder, "few_shots")),
-                executor.submit(save_summaries_to_sqlite, idx_plus_one, OFFLINE_PIPELINE_TEST_NAME, datetime.datetime.now(),
-                                commit['llama_category'],
-                                commit['llama_summary'], summary_retrieved_docs,
-                                commit['llama_tech_summary'], tech_summary_retrieved_docs),
-                executor.submit(save_commit_to_chromadb, commit, idx_plus_one, SummaryType.GENERAL),
-                executor.submit(save_commit_to_chromadb, commit, idx_plus_one, SummaryType.TECHNICAL)
-            ]
-            concurrent.futures.wait(futures)
+    # Up to OFFLINE_COMMITS_IN_FLIGHT commits are processed concurrently, while the results are saved in order.
+    # The processed commits are recorded in batches, when CHROMA_BATCH_SIZE summaries are buffered
+    # or CHROMA_FLUSH_INTERVAL seconds passed
+    checkpoint_file = checkpoint_path(current_directory + '/' + commits_folder, checkpoint_name)
+    in_flight = collections.deque()
+    processed = []
+    last_record = time.monotonic()
+    # Each commit retrieves only the commits recorded before it was submitted (the previous runs and the batches
+    # already written), so the similar commits it gets don't depend on the timing of the concurrent ones
+    last_saved_index = min(commits_few_shots, default=0)
+
+    try:
+        # the pools are shared by all the commits, so their threads (and their SQLite connections) are reused;
+        # the LLM tasks have their own pool, since the commits wait for them
+        with concurrent.futures.ThreadPoolExecutor(max_workers=OFFLINE_COMMITS_IN_FLIGHT) as executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=3 * OFFLINE_COMMITS_IN_FLIGHT) as task_executor, \
+                tqdm(total=len(commits_few_shots)) as progress_bar:
+            for idx, commit in commits_few_shots.items():
+                future = executor.submit(process_commit, commit, idx + 1, llama_model, ollama_client,
+                                         task_executor, last_saved_index)
+                in_flight.append((idx, commit, future))
+
+                if len(in_flight) >= OFFLINE_COMMITS_IN_FLIGHT:
+                    processed.append(save_processed_commit(*in_flight.popleft()))
+                    progress_bar.update()
+
+                # two summaries (general and technical) per commit
+                if 2 * len(processed) >= CHROMA_BATCH_SIZE or \
+                        (processed and time.monotonic() - last_record >= CHROMA_FLUSH_INTERVAL):
+                    batch, processed = processed, []
+                    record_processed_commits(checkpoint_file, batch)
+                    last_saved_index = batch[-1][0] + 1
+                    last_record = time.monotonic()
+
+            while in_flight:
+                processed.append(save_processed_commit(*in_flight.popleft()))
+                progress_bar.update()
+    finally:
+        # the commits processed before an interruption are recorded too
+        batch, processed = processed, []
+        record_processed_commits(checkpoint_file, batch)
 
     logger.debug("All commits processed and saved successfully.")
+    logger.debug(f"Embedding cache: {get_embeddings().stats()}")
+    print(f"Embedding cache: {get_embeddings().stats()}")
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 from online_pipeline_models.pipeline_factory import get_chat_pipeline
 
-HELP = " - \033[1;3m/exit\033[0m to exit \n - \033[1;3m/reset\033[0m to clear memory"
+HELP = " - \033[1;3m/exit\033[0m to exit \n - \033[1;3m/reset\033[0m to clear memory" \
+       " \n - \033[1;3m/stats\033[0m to show the cache statistics"
 
 MODEL_CHOICES = ["simple", "multi_query", "chain_agent_react", "graph_agent_react_vanilla", "graph_agent_react"]
 
@@ -17,7 +18,16 @@ def interactive_cli(model_name: str):
             pipe.reset()
             print("(memory cleared)")
             continue
-        print("Assistant:", pipe.ask(msg))
+        if cmd == "/stats":
+            for cache, stats in pipe.cache_stats().items():
+                print(f"{cache}: " + ", ".join(f"{name}={value:.2f}" if isinstance(value, float) else f"{name}={value}"
+                                               for name, value in stats.items()))
+            continue
+        # print the reply while it is generated
+        print("Assistant: ", end="", flush=True)
+        for chunk in pipe.ask_stream(msg):
+            print(chunk, end="", flush=True)
+        print()
 
 def select_model():
     print("Select a model:")
@@ -0,0 +1,153 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from online_pipeline_models.models.models_utils.nl2sql_cache import parameterize_question
+from utils.chroma_registry import get_chroma_client
+from utils.config import ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY, \
+    COMMITS_COLLECTION_NAME, CHROMA_METADATA, SQL_PERSIST_DIR, ANSWER_CACHE_VERSION_INTERVAL
+from utils.embedding_cache import get_embeddings
+from utils.llm_utils import normalize_question
+from utils.sqlite_connection import get_connection
+
+
+def data_version() -> tuple:
+    """
+    Returns a fingerprint of the commit data the answers are based on:
+    it changes when commits are added to (or removed from) the `commits` table or the commits collection.
+    """
+    cursor = get_connection(SQL_PERSIST_DIR).cursor()
+    cursor.execute("SELECT COUNT(*), MAX(id) FROM commits")
+    count, max_id = cursor.fetchone()
+    collection = get_chroma_client().get_or_create_collection(COMMITS_COLLECTION_NAME, metadata=CHROMA_METADATA)
+    return count, max_id, collection.count()
+
+
+# Tokens that the embeddings barely distinguish but that change the answer: numbers (years, issues, counts),
+# identifiers (js_pushstring) and proper names (authors), except the first word of the question
+_SPECIFIC_TOKEN_RE = re.compile(r"\b\d+\b|\b[A-Za-z]\w*_\w*\b|(?<!^)\b[A-Z][a-z]+\b")
+
+
+def question_literals(question: str) -> tuple[str, ...]:
+    """
+    Returns the literals of a question (quoted strings, dates, hashes, file names, numbers, identifiers and names),
+    which must be the same for two questions to have the same answer.
+    """
+    _, literals = parameterize_question(question)
+    literals += _SPECIFIC_TOKEN_RE.findall(question.strip())
+    return tuple(sorted({literal.lower() for literal in literals}))
+
+
+def _cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """
+    In-memory cache of the answers of a chat pipeline.
+    A question hits the cache if its normalized text was already asked (exact match), or if its embedding
+    is at least `similarity_threshold` similar to the one of a cached question with the same literals
+    (near-duplicate): "commits in 2023" never gets the answer of "commits in 2024".
+    Answers expire after `ttl` seconds, the least recently used ones are evicted beyond `max_entries`,
+    and the whole cache is cleared when the commit data changes (see `data_version`, checked at most every
+    `version_interval` seconds).
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY, version_interval=ANSWER_CACHE_VERSION_INTERVAL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.version_interval = version_interval
+        self.embeddings = get_embeddings()
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.version = None
+        self.version_checked = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, question: str) -> str | None:
+        """
+        Returns the cached answer of the question, or None.
+        """
+        key = normalize_question(question)
+        self._check_version()
+
+        with self.lock:
+            self._evict_expired()
+            entry = self.entries.get(key)
+            near_duplicate = entry is None and bool(self.entries)
+
+        # the question is embedded outside the lock
+        literals = question_literals(question) if near_duplicate else None
+        vector = self.embeddings.embed_query(key) if near_duplicate else None
+
+        with self.lock:
+            if near_duplicate:
+                # the most similar cached question with the same literals, above the threshold
+                scored = [(_cosine_similarity(vector, e["vector"]), k) for k, e in self.entries.items()
+                          if e["literals"] == literals]
+                if scored:
+                    similarity, best_key = max(scored)
+                    if similarity >= self.similarity_threshold:
+                        key, entry = best_key, self.entries[best_key]
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            return entry["answer"]
+
+    def put(self, question: str, answer: str) -> None:
+        """
+        Caches the answer of the question.
+        """
+        key = normalize_question(question)
+        vector = self.embeddings.embed_query(key)
+
+        with self.lock:
+            self.entries[key] = {"answer": answer, "vector": vector, "literals": question_literals(question),
+                                 "created": time.monotonic()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the number of cached answers and of the questions answered from the cache or not."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _check_version(self) -> None:
+        # the answers about the old data are no longer valid; the data is queried at most every version_interval
+        now = time.monotonic()
+        with self.lock:
+            if self.version_checked is not None and now - self.version_checked < self.version_interval:
+                return
+        version = data_version()
+        with self.lock:
+            self.version_checked = now
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def _evict_expired(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        for key in [k for k, e in self.entries.items() if e["created"] < deadline]:
+            del self.entries[key]
@@ -1,28 +1,101 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Iterator
+
+from online_pipeline_models.answer_cache import AnswerCache
+from utils.config import ANSWER_CACHE_ENABLED
+from utils.embedding_cache import get_embeddings
 
 class BaseChatPipeline(ABC):
     """
     Base class for chat-based pipelines.
     Each one must maintain an internal conversation state.
+    If ANSWER_CACHE_ENABLED, the answers of the questions that open a conversation are cached:
+    the follow-up questions are never served from the cache, since their answer depends on the previous turns.
     """
 
     def __init__(self):
         self.chat_history: List[Dict[str, str]] = []
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
 
     @abstractmethod
     def _respond(self, user_message: str) -> str:
         """Implemented by subclasses: generates the model's response."""
 
+    def _respond_stream(self, user_message: str) -> Iterator[str]:
+        """
+        Overridden by subclasses that support streaming: yields the model's response in chunks.
+        By default the whole response is yielded as a single chunk.
+        """
+        yield self._respond(user_message)
+
+    def _remember(self, user_message: str, assistant_reply: str) -> None:
+        """
+        Overridden by subclasses with their own memory: saves a turn answered from the cache,
+        so that the next questions can refer to it.
+        """
+
+    def _cached_answer(self, user_message: str) -> str | None:
+        if self.answer_cache is None or self.chat_history:
+            return None
+        return self.answer_cache.get(user_message)
+
     def ask(self, user_message: str) -> str:
         """
         Adds the user's turn to the history, calls `_respond`, saves the reply, and returns it.
         """
+        cacheable = self.answer_cache is not None and not self.chat_history
+        cached_reply = self._cached_answer(user_message)
+
         self.chat_history.append({"role": "user", "content": user_message})
-        assistant_reply = self._respond(user_message)
+        if cached_reply is not None:
+            assistant_reply = cached_reply
+            self._remember(user_message, assistant_reply)
+        else:
+            assistant_reply = self._respond(user_message)
+            if cacheable:
+                self.answer_cache.put(user_message, assistant_reply)
         self.chat_history.append({"role": "assistant", "content": assistant_reply})
         return assistant_reply
 
+    def ask_stream(self, user_message: str) -> Iterator[str]:
+        """
+        Streaming version of `ask`: yields the reply chunks as soon as they are generated,
+        then saves the streamed reply in the history. If the consumer stops early, the part streamed so far is saved.
+        """
+        cacheable = self.answer_cache is not None and not self.chat_history
+        cached_reply = self._cached_answer(user_message)
+
+        self.chat_history.append({"role": "user", "content": user_message})
+        if cached_reply is not None:
+            self._remember(user_message, cached_reply)
+            self.chat_history.append({"role": "assistant", "content": cached_reply})
+            yield cached_reply
+            return
+
+        chunks = []
+        stream = self._respond_stream(user_message)
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+            # only complete replies are cached
+            if cacheable:
+                self.answer_cache.put(user_message, "".join(chunks))
+        finally:
+            # also when the consumer stops early, so that the user turn always has a reply
+            stream.close()
+            self.chat_history.append({"role": "assistant", "content": "".join(chunks)})
+
+    def cache_stats(self) -> Dict[str, dict]:
+        """
+        Returns the counters of the caches used by the pipeline, by cache.
+        Overridden by subclasses with their own caches.
+        """
+        stats = {"embeddings": get_embeddings().stats()}
+        if self.answer_cache is not None:
+            stats["answers"] = self.answer_cache.stats()
+        return stats
+
     def reset(self):
         """Clears the history (useful for tests or new conversations)."""
         self.chat_history.clear()
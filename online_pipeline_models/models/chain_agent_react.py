@@ -1,4 +1,3 @@
-import sqlite3
 import warnings
 
 from langchain.agents import initialize_agent, AgentType
@@ -6,14 +5,14 @@ from langchain.chains.llm import LLMChain
 from langchain.memory import ConversationBufferMemory
 from langchain.prompts.chat import SystemMessagePromptTemplate
 from langchain.tools import Tool
-from langchain_chroma import Chroma
 from langchain_core.prompts import PromptTemplate
 from langchain_ollama import ChatOllama
-from langchain_ollama import OllamaEmbeddings
 
 from online_pipeline_models.base_chat_pipeline import BaseChatPipeline
-from utils.config import ONLINE_MODEL_NAME, EMBEDDING_MODEL, COMMITS_COLLECTION_NAME, CHROMA_PERSIST_DIR, SQL_PERSIST_DIR, \
-    GENERAL_DOCS_COLLECTION_NAME, NUM_CTX, CHROMA_METADATA
+from utils.chroma_registry import get_collection
+from utils.config import ONLINE_MODEL_NAME, COMMITS_COLLECTION_NAME, SQL_PERSIST_DIR, \
+    GENERAL_DOCS_COLLECTION_NAME, NUM_CTX
+from utils.sqlite_connection import get_connection
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
@@ -27,17 +26,10 @@ memory = ConversationBufferMemory(memory_key="chat_history", return_messages=Tru
 
 # ---- Vector Store and Retrievers ----
 # commits
-chroma_commits = Chroma(
-    collection_name=COMMITS_COLLECTION_NAME,
-    embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL),
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+chroma_commits = get_collection(COMMITS_COLLECTION_NAME)
 retriever_commits = chroma_commits.as_retriever(search_kwargs={"k": 5})
 
 SQLITE_PATH = SQL_PERSIST_DIR
-conn = sqlite3.connect(SQLITE_PATH)
-cursor = conn.cursor()
 
 few_shots = [
     (
@@ -105,12 +97,7 @@ sql_prompt = PromptTemplate(
 sql_chain = LLMChain(llm=ollama_llm, prompt=sql_prompt)
 
 # general docs
-chroma_docs = Chroma(
-    collection_name=GENERAL_DOCS_COLLECTION_NAME,
-    embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL),
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+chroma_docs = get_collection(GENERAL_DOCS_COLLECTION_NAME)
 retriever_docs = chroma_docs.as_retriever(search_kwargs={"k": 5})
 
 
@@ -154,6 +141,7 @@ def nl_to_sql_commit_context(query: str) -> str:
                 f"Generated query: {sql_query}")
 
     try:
+        cursor = get_connection(SQLITE_PATH).cursor()
         cursor.execute(sql_query)
         rows = cursor.fetchall()
         header = [col[0] for col in cursor.description]
@@ -229,6 +217,10 @@ class ChainAgentReact(BaseChatPipeline):
     def reset(self):
         """Reset the chat history."""
         self.chain.memory.clear()
+        super().reset()
+
+    def _remember(self, user_message: str, assistant_reply: str) -> None:
+        self.chain.memory.save_context({"input": user_message}, {"output": assistant_reply})
 
     def _respond(self, user_message: str) -> str:
         res = self.chain.invoke({"input": user_message})
@@ -1,22 +1,17 @@
+from typing import Iterator
+
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.prompts import PromptTemplate
-from langchain_chroma import Chroma
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_ollama import OllamaEmbeddings
 from langchain_ollama.llms import OllamaLLM
 
 from online_pipeline_models.base_chat_pipeline import BaseChatPipeline
-from utils.config import NUM_CTX, ONLINE_MODEL_NAME, COMMITS_COLLECTION_NAME, EMBEDDING_MODEL, CHROMA_PERSIST_DIR, \
-    CHROMA_METADATA
+from utils.chroma_registry import get_collection
+from utils.config import NUM_CTX, ONLINE_MODEL_NAME, COMMITS_COLLECTION_NAME
 
 # -- Vector store & retriever --------------------------------------------------
-chroma_simple = Chroma(
-    collection_name=COMMITS_COLLECTION_NAME,
-    embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL),
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+chroma_simple = get_collection(COMMITS_COLLECTION_NAME)
 retriever = chroma_simple.as_retriever()
 
 # -- LLM -----------------------------------------------------------------------
@@ -73,4 +68,10 @@ class ChainSimple(BaseChatPipeline):
 
     def _respond(self, user_message: str) -> str:
         res = self.chain.invoke({"input": user_message, "chat_history": self.chat_history})
-        return res["answer"]
\ No newline at end of file
+        return res["answer"]
+
+    def _respond_stream(self, user_message: str) -> Iterator[str]:
+        # the retrieval chain streams the input and the context first, then the answer tokens
+        for chunk in self.chain.stream({"input": user_message, "chat_history": self.chat_history}):
+            if "answer" in chunk:
+                yield chunk["answer"]
\ No newline at end of file
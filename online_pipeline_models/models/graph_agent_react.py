@@ -1,61 +1,60 @@
+import asyncio
 import os
-import sqlite3
+import re
 from datetime import date
 from pathlib import Path
+from typing import Iterator
 
-from langchain_chroma import Chroma
+from langchain_core.messages import AIMessageChunk
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import tool
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_core.tools import StructuredTool
+from langchain_ollama import ChatOllama
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import create_react_agent
 
 from online_pipeline_models.base_chat_pipeline import BaseChatPipeline
 from online_pipeline_models.models.models_utils.graph_agent_react_nl2sql_examples import \
     graph_agent_react_nl2sql_examples_examples
-from utils.config import ONLINE_MODEL_NAME, NUM_CTX, EMBEDDING_MODEL, COMMITS_COLLECTION_NAME, CHROMA_PERSIST_DIR, \
-    GENERAL_DOCS_COLLECTION_NAME, CHROMA_METADATA, SQL_PERSIST_DIR, SEMANTIC_CODE_COLLECTION
+from online_pipeline_models.models.models_utils.nl2sql_cache import SQLTranslationCache
+from online_pipeline_models.models.models_utils.nl2sql_templates import match_sql_template
+from online_pipeline_models.models.models_utils.sql_pager import SQLResultPager
+from online_pipeline_models.models.models_utils.context_packer import ContextPacker, count_tokens
+from online_pipeline_models.models.models_utils.tool_metrics import ToolLatencyRecorder, ToolTokenRecorder
+from utils.chroma_registry import get_collection
+from utils.config import ONLINE_MODEL_NAME, NUM_CTX, COMMITS_COLLECTION_NAME, \
+    GENERAL_DOCS_COLLECTION_NAME, SQL_PERSIST_DIR, SEMANTIC_CODE_COLLECTION, SQL_TOOL_MAX_ROWS
 from utils.git_utils import format_code
+from utils.lexical_index import get_lexical_index, hybrid_search
+from utils.sqlite_utils import retrieve_symbols
 
 today_str = date.today().isoformat()
 
 
-# -------------------- LLM & Embeddings --------------------
+# -------------------- LLM --------------------
 llm = ChatOllama(
     model=ONLINE_MODEL_NAME,
     num_ctx=NUM_CTX,
     temperature=0.0,
     extract_reasoning=True
 )
-embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
 
 # -------------------- Vector Stores --------------------
 # Commits (summaries, code diffs & messages)
-commit_store = Chroma(
-    collection_name=COMMITS_COLLECTION_NAME,
-    embedding_function=embeddings,
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
-retriever_commits = commit_store.as_retriever(search_kwargs={"k": 10})
+commit_store = get_collection(COMMITS_COLLECTION_NAME)
 
 # General documentation
-doc_store = Chroma(
-    collection_name=GENERAL_DOCS_COLLECTION_NAME,
-    embedding_function=embeddings,
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+doc_store = get_collection(GENERAL_DOCS_COLLECTION_NAME)
 retriever_docs = doc_store.as_retriever(search_kwargs={"k": 5})
 
 # Semantic Code
-code_store = Chroma(
-    collection_name=SEMANTIC_CODE_COLLECTION,
-    embedding_function=embeddings,
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+code_store = get_collection(SEMANTIC_CODE_COLLECTION)
+
+# Lexical (BM25) index of commits and code, combined with the vector search by `hybrid_search`
+# (aligned at startup with the collections filled before its creation)
+lexical_index = get_lexical_index()
+lexical_index.sync(commit_store, COMMITS_COLLECTION_NAME)
+lexical_index.sync(code_store, SEMANTIC_CODE_COLLECTION)
 
 
 # -------------------- Helper --------------------
@@ -75,38 +74,77 @@ def _format_commit(doc) -> str:
 
 
 # -------------------- Tools --------------------
+# Each tool has a sync and an async implementation: when the model emits several tool calls in one step,
+# the async ones run concurrently on the event loop (the sync ones in the ToolNode thread pool).
+# The latency of each call is recorded in `tool_latencies`.
+tool_latencies = ToolLatencyRecorder()
+# The retrieved documents are packed in a token budget (deduplicated, long ones cut to their relevant lines),
+# and the tokens returned by each call are recorded in `tool_tokens`.
+context_packer = ContextPacker()
+tool_tokens = ToolTokenRecorder()
+
+
+def _pack(tool_name: str, query: str, documents: list[str], empty_message: str) -> str:
+    """Packs the formatted documents of a tool call in the context budget and records their tokens."""
+    result = context_packer.pack(query, documents) if documents else empty_message
+    tool_tokens.record(tool_name, sum(count_tokens(d) for d in documents), count_tokens(result))
+    return result
+
+
 # Tool 1 - Commit Code Search
-@tool(
-    name_or_callable="commit_code",
+def _format_commits(query: str, docs) -> str:
+    return _pack("commit_code", query, [_format_commit(d) for d in docs], "No relevant commits found.")
+
+
+def _commit_code(query: str) -> str:
+    """Retrieves information about commits from the MuJS repository."""
+    with tool_latencies.measure("commit_code"):
+        # Retrieves relevant documents based on the query (semantic and lexical search)
+        return _format_commits(query, hybrid_search(commit_store, COMMITS_COLLECTION_NAME, query, k=10))
+
+
+async def _acommit_code(query: str) -> str:
+    """Retrieves information about commits from the MuJS repository."""
+    with tool_latencies.measure("commit_code"):
+        docs = await asyncio.to_thread(hybrid_search, commit_store, COMMITS_COLLECTION_NAME, query, 10)
+        return _format_commits(query, docs)
+
+
+commit_code = StructuredTool.from_function(
+    func=_commit_code,
+    coroutine=_acommit_code,
+    name="commit_code",
     description="""
         Use this tool to retrieve information about functions, code, source files, code changes, or commits.
     """
 )
-def commit_code(query: str) -> str:
-    """Retrieves information about commits from the MuJS repository."""
-    # Retrieves relevant documents based on the query
-    docs = retriever_commits.invoke(query)
-    if not docs:
-        return "No relevant commits found."
-
-    formatted = [_format_commit(d) for d in docs]
-    return "\n\n".join(formatted)
 
 
 # Tool 2 - General Project Information
-@tool(
-    name_or_callable="general_project_info",
+def _format_general_docs(query: str, docs) -> str:
+    return _pack("general_project_info", query, [d.page_content for d in docs], "No relevant documentation found.")
+
+
+def _general_project_info(query: str) -> str:
+    """Retrieves only general project information from the MuJS documentation."""
+    with tool_latencies.measure("general_project_info"):
+        return _format_general_docs(query, retriever_docs.invoke(query))
+
+
+async def _ageneral_project_info(query: str) -> str:
+    """Retrieves only general project information from the MuJS documentation."""
+    with tool_latencies.measure("general_project_info"):
+        return _format_general_docs(query, await retriever_docs.ainvoke(query))
+
+
+general_project_info = StructuredTool.from_function(
+    func=_general_project_info,
+    coroutine=_ageneral_project_info,
+    name="general_project_info",
     description="""
         Use this tool to retrieve general information about the project.
     """
 )
-def general_project_info(query: str) -> str:
-    """Retrieves only general project information from the MuJS documentation."""
-    docs = retriever_docs.invoke(query)
-    if not docs:
-        return "No relevant documentation found."
-
-    return "\n---\n".join(d.page_content for d in docs)
 
 
 SQLITE_PATH = SQL_PERSIST_DIR
@@ -117,13 +155,24 @@ sql_prompt = PromptTemplate(
         You are an expert SQLite assistant.
         Translate the user's question into the SHORTEST valid SQL query 
         that queries ONLY the table `commits`
-        (id, commit_hash, author, date, message, files, diffs).
+        (id, commit_hash, author, date, message, files, diffs)
+        and its full-text index `commits_fts` (message, files, diffs), joined with commits_fts.rowid = commits.id,
+        and the table `commit_files` (commit_id, path, lines_added, lines_removed, diff_text), 
+        with one row for each file changed by a commit, joined with commit_files.commit_id = commits.id.
         
         For author matching, use the LIKE operator with patterns such as:
         Alice Smith → author LIKE '%Alice%Smith%' OR author LIKE '%Smith%Alice%'.
         
-        For date matching, use LIKE because dates include time:
-        2025-05-12 → date LIKE '2025-05-12%'.
+        For date matching, use ranges because dates include time:
+        2025-05-12 → date >= '2025-05-12' AND date < '2025-05-13'.
+        
+        For commit hashes, use a prefix match: ef01dead → commit_hash LIKE 'ef01dead%'.
+        
+        For words in messages, files or diffs, use MATCH on `commits_fts` instead of LIKE:
+        message mentions refactor → commits_fts MATCH 'message:refactor*'.
+        
+        For questions about specific files (history, changes, churn), use `commit_files`:
+        file jsarray.c → commit_files.path = 'jsarray.c'.
         
         ⚠️  Reply **only** with the SQL query—no commentary, no ``` fencing.
         You can only do SELECT queries.
@@ -140,102 +189,267 @@ sql_chain = sql_prompt | llm
 
 
 # Tool 3 - Natural‑language → SQL
-@tool(
-    name_or_callable="nl_to_sql_commit_context",
-    description="""
-        Use this tool to query the `commits` table for filtered/aggregated/counted data 
-        about commit hashes, authors, dates, messages, files, diffs, and related counts.
-    """
-)
-def nl_to_sql_commit_context(question: str) -> str:
+# Recurring question shapes are translated by the templates, and the LLM translations are cached,
+# so that these questions go straight to SQLite
+sql_cache = SQLTranslationCache()
+# The results are returned one page at a time, to keep the tool responses small
+sql_pager = SQLResultPager(SQLITE_PATH)
+
+
+def _cached_translation(question: str) -> tuple[str, list, bool] | None:
     """
-    Process a natural-language question about summaries and execute the corresponding SQL query.
-    1. Convert a natural-language question into SQL via LLM.
-    2. Execute the SELECT on SQLite and return the results.
+    Translates the question without the LLM, with the SQL templates or a cached translation.
+
+    Returns:
+        tuple | None: The SQL query, its parameters, and whether it comes from the translation cache.
     """
-    sql_query = sql_chain.invoke({"question": question}).content.strip()
+    template = match_sql_template(question)
+    if template is not None:
+        return *template, False
 
+    sql_query = sql_cache.get(question)
+    return (sql_query, [], True) if sql_query is not None else None
+
+
+def _format_page(shown_query: str, header: list[str], rows: list[str], offset: int, token: str | None) -> str:
+    if not rows:
+        return f"SQL:\n{shown_query}\n\nNo rows returned."
+
+    result = (
+        f"SQL:\n{shown_query}\n\n"
+        f"Results (header → {header}, rows {offset + 1}-{offset + len(rows)}):\n" + "\n".join(rows)
+    )
+    if token is not None:
+        result += f"\n\nMore rows are available: call this tool with continuation_token=\"{token}\" to get them."
+    return result
+
+
+def _execute_sql(sql_query: str, params=(), question: str | None = None, cached_question: str | None = None) -> str:
+    """
+    Executes a SELECT on SQLite and formats the first page of results.
+    If `question` is given (a query generated by `sql_chain`), the query is cached if it returns rows.
+    If `cached_question` is given (a query read from the translation cache), the query is evicted if it fails.
+    """
     if not sql_query.lower().startswith("select"):
         return (
             "For safety I only execute SELECT statements.\n"
             f"Generated query: {sql_query}"
         )
 
+    shown_query = f"{sql_query}\nParameters: {list(params)}" if params else sql_query
     try:
-        conn = sqlite3.connect(SQLITE_PATH)
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        header = [col[0] for col in cursor.description]
+        header, rows, token = sql_pager.fetch(sql_query, params)
 
-        if not rows:
-            return f"SQL:\n{sql_query}\n\nNo rows returned."
+        # a query without rows may not answer the question (e.g. a wrong column value)
+        if question is not None and rows:
+            sql_cache.put(question, sql_query)
 
-        formatted_rows = "\n".join(", ".join(map(str, r)) for r in rows)
-        return (
-            f"SQL:\n{sql_query}\n\nResults (header → {header}):\n{formatted_rows}"
-        )
+        return _format_page(shown_query, header, rows, 0, token)
     except Exception as e:
-        return f"Error executing:\n{sql_query}\n\n{e}"
+        if cached_question is not None:
+            sql_cache.evict(cached_question)
+        return f"Error executing:\n{shown_query}\n\n{e}"
 
 
-# Tool 4 - Semantic Search on Actual Code
-@tool(
-    name_or_callable="semantic_code",
-    description="""
-        Use this tool to search and explain *current* source code
-#         (functions, structures, logic) in the master branch of MuJS.
-        If you mention specific files or base names, wrap them like §opnames.h§ or §opnames§
-        before calling this tool, so it can filter precisely by file_name or stem.
+def _next_sql_page(continuation_token: str) -> str:
+    """Executes the next page of a query returned with a continuation token."""
+    try:
+        sql_query, params, offset = sql_pager.resume(continuation_token)
+    except KeyError:
+        return f"Unknown or expired continuation token: {continuation_token}. Ask the question again."
+
+    shown_query = f"{sql_query}\nParameters: {list(params)}" if params else sql_query
+    try:
+        header, rows, token = sql_pager.fetch(sql_query, params, offset)
+        return _format_page(shown_query, header, rows, offset, token)
+    except Exception as e:
+        return f"Error executing:\n{shown_query}\n\n{e}"
+
+
+def _record_sql_page(page: str) -> str:
+    # the pages are already bounded by the pager (rows, characters and cell length): only their tokens are recorded
+    tokens = count_tokens(page)
+    tool_tokens.record("nl_to_sql_commit_context", tokens, tokens)
+    return page
+
+
+def _nl_to_sql_commit_context(question: str, continuation_token: str = "") -> str:
+    """
+    Process a natural-language question about summaries and execute the corresponding SQL query.
+    1. Convert a natural-language question into SQL via templates, cache or LLM.
+    2. Execute the SELECT on SQLite and return the first page of results.
+    With a continuation token, the next page of a previous query is returned instead.
+    """
+    with tool_latencies.measure("nl_to_sql_commit_context"):
+        if continuation_token:
+            return _record_sql_page(_next_sql_page(continuation_token))
+
+        translation = _cached_translation(question)
+        if translation is not None:
+            sql_query, params, from_cache = translation
+            return _record_sql_page(_execute_sql(sql_query, params, cached_question=question if from_cache else None))
+
+        sql_query = sql_chain.invoke({"question": question}).content.strip()
+        return _record_sql_page(_execute_sql(sql_query, question=question))
+
+
+async def _anl_to_sql_commit_context(question: str, continuation_token: str = "") -> str:
+    """Async version of `_nl_to_sql_commit_context`: SQLite is accessed in worker threads (with their own connection)."""
+    with tool_latencies.measure("nl_to_sql_commit_context"):
+        if continuation_token:
+            return _record_sql_page(await asyncio.to_thread(_next_sql_page, continuation_token))
+
+        translation = await asyncio.to_thread(_cached_translation, question)
+        if translation is not None:
+            sql_query, params, from_cache = translation
+            return _record_sql_page(await asyncio.to_thread(_execute_sql, sql_query, params, None,
+                                                            question if from_cache else None))
+
+        sql_query = (await sql_chain.ainvoke({"question": question})).content.strip()
+        return _record_sql_page(await asyncio.to_thread(_execute_sql, sql_query, (), question))
+
+
+nl_to_sql_commit_context = StructuredTool.from_function(
+    func=_nl_to_sql_commit_context,
+    coroutine=_anl_to_sql_commit_context,
+    name="nl_to_sql_commit_context",
+    description=f"""
+        Use this tool to query the `commits` table for filtered/aggregated/counted data 
+        about commit hashes, authors, dates, messages, files, diffs, and related counts.
+        It returns at most {SQL_TOOL_MAX_ROWS} rows per call, with long values truncated.
+        When more rows are available, it returns a continuation token: call it again with the same question
+        and `continuation_token` set to that token to get the next rows.
     """
 )
-def semantic_code(query: str) -> str:
+
+
+# Tool 4 - Semantic Search on Actual Code
+def _extract_markers(text: str) -> list[str]:
+    # Split on '§' and take odd positions → tokens inside §...§
+    parts = text.split("§")
+    return [p.strip() for i, p in enumerate(parts) if i % 2 == 1 and p.strip()]
+
+
+def _code_filter(query: str) -> dict | None:
+    """Builds the metadata filter for the files marked in the query (§filename.ext§ or §stem§), if any."""
+    marks = _extract_markers(query)
+    if not marks:
+        return None
+
+    conditions = []
+    for raw in marks[:10]:  # cap
+        tok = os.path.basename(raw.strip())
+        if "." in tok:  # looks like a full filename
+            # add both .c and .h if applicable, since they are theoretically linked
+            if tok.endswith(".c"):
+                conditions.append({"file_name": {"$eq": tok}})
+                conditions.append({"file_name": {"$eq": f"{Path(tok).stem}.h"}})
+            elif tok.endswith(".h"):
+                conditions.append({"file_name": {"$eq": tok}})
+                conditions.append({"file_name": {"$eq": f"{Path(tok).stem}.c"}})
+            else:
+                conditions.append({"file_name": {"$eq": tok}})
+        else:  # looks like a stem
+            conditions.append({"stem": {"$eq": tok}})
+    # add the filters
+    return {"$or": conditions} if len(conditions) > 1 else conditions[0]
+
+
+# Identifiers that may be symbols of the MuJS sources: `name`, name() or names with an underscore (js_pushstring)
+_SYMBOL_RE = re.compile(r"`(\w+)`|\b(\w+)\s*\(\)|\b([A-Za-z]\w*_\w*)\b")
+
+
+def _lookup_symbols(query: str) -> list[str] | None:
+    """
+    Looks up the identifiers of the query in the symbol table, for exact questions about functions, structs,
+    typedefs and macros. Returns their formatted definitions, or None if the query names no known symbol.
+    Questions about files (with markers) are left to the semantic search.
+    """
+    if _extract_markers(query):
+        return None
+
+    names = []
+    for m in _SYMBOL_RE.finditer(query):
+        name = next(group for group in m.groups() if group)
+        if name not in names:
+            names.append(name)
+
+    symbols = retrieve_symbols(names[:10])
+    if not symbols:
+        return None
+
+    return [
+        f"FILE: {symbol['file_path']} (lines {symbol['start_line']}-{symbol['end_line']})\n"
+        f"SYMBOL: {symbol['kind']} {symbol['name']}\n"
+        f"SIGNATURE: {symbol['signature']}\n"
+        f"---\n{symbol['code']}"
+        for symbol in symbols
+    ]
+
+
+def _format_code_results(query: str, docs) -> str:
+    return _pack("semantic_code", query, [format_code(d) for d in docs], "No relevant code snippets found.")
+
+
+def _semantic_code(query: str) -> str:
     """
     It performs a semantic search on the MuJS codebase to find relevant code snippets
     This tool is useful for understanding the implementation of specific functions or logic in the codebase.
+    0. If the query names known symbols (e.g. js_pushstring), their definitions are returned from the symbol table.
     1. It first checks if there are any markers (like §filename.ext§ or §stem§) in the query.
     2. If markers are found, it filters the search based on these markers through metadata filtering.
-    3. If no markers are found or if the filtered search yields no results, it falls back to a general semantic search.
-    4. The results are formatted and returned as a string.
+    3. If no markers are found or if the filtered search yields no results, it falls back to a general search,
+       fusing the semantic search with a lexical (BM25) search on identifiers.
+    4. The results are formatted and packed in the context budget (duplicates removed, long chunks cut to the
+       lines relevant to the query).
     5. If no relevant code snippets are found, it returns a message indicating so.
     """
-    def _extract_markers(text: str) -> list[str]:
-        # Split on '§' and take odd positions → tokens inside §...§
-        parts = text.split("§")
-        return [p.strip() for i, p in enumerate(parts) if i % 2 == 1 and p.strip()]
-
-    marks = _extract_markers(query)
-
-    if marks:
-        conditions = []
-        for raw in marks[:10]:  # cap
-            tok = os.path.basename(raw.strip())
-            if "." in tok:  # looks like a full filename
-                # add both .c and .h if applicable, since they are theoretically linked
-                if tok.endswith(".c"):
-                    conditions.append({"file_name": {"$eq": tok}})
-                    conditions.append({"file_name": {"$eq": f"{Path(tok).stem}.h"}})
-                elif tok.endswith(".h"):
-                    conditions.append({"file_name": {"$eq": tok}})
-                    conditions.append({"file_name": {"$eq": f"{Path(tok).stem}.c"}})
-                else:
-                    conditions.append({"file_name": {"$eq": tok}})
-            else:  # looks like a stem
-                conditions.append({"stem": {"$eq": tok}})
-        # add the filters
-        meta_filter = {"$or": conditions} if len(conditions) > 1 else conditions[0]
-
-        # search with metadata filter
-        docs = code_store.similarity_search(query, k=12, filter=meta_filter)
-        if docs:
-            return "\n\n".join(format_code(d) for d in docs)
-
-    # fallback: no markers or no results with them
-    res = code_store.similarity_search_with_relevance_scores(query, k=8, score_threshold=0.35)
-    if not res:
-        return "No relevant code snippets found."
-
-    return "\n\n".join(format_code(d) for d, s in res)
+    with tool_latencies.measure("semantic_code"):
+        # exact symbol lookup, without vector search
+        symbols = _lookup_symbols(query)
+        if symbols is not None:
+            return _pack("semantic_code", query, symbols, "")
+
+        meta_filter = _code_filter(query)
+        if meta_filter is not None:
+            # search with metadata filter
+            docs = code_store.similarity_search(query, k=12, filter=meta_filter)
+            if docs:
+                return _format_code_results(query, docs)
+
+        # fallback: no markers or no results with them (semantic and lexical search)
+        docs = hybrid_search(code_store, SEMANTIC_CODE_COLLECTION, query, k=8, score_threshold=0.35)
+        return _format_code_results(query, docs)
+
+
+async def _asemantic_code(query: str) -> str:
+    """Async version of `_semantic_code`."""
+    with tool_latencies.measure("semantic_code"):
+        symbols = await asyncio.to_thread(_lookup_symbols, query)
+        if symbols is not None:
+            return _pack("semantic_code", query, symbols, "")
+
+        meta_filter = _code_filter(query)
+        if meta_filter is not None:
+            docs = await code_store.asimilarity_search(query, k=12, filter=meta_filter)
+            if docs:
+                return _format_code_results(query, docs)
+
+        docs = await asyncio.to_thread(hybrid_search, code_store, SEMANTIC_CODE_COLLECTION, query, 8, 0.35)
+        return _format_code_results(query, docs)
+
+
+semantic_code = StructuredTool.from_function(
+    func=_semantic_code,
+    coroutine=_asemantic_code,
+    name="semantic_code",
+    description="""
+        Use this tool to search and explain *current* source code
+#         (functions, structures, logic) in the master branch of MuJS.
+        If you mention specific files or base names, wrap them like §opnames.h§ or §opnames§
+        before calling this tool, so it can filter precisely by file_name or stem.
+    """
+)
 
 
 # -------------------- Agent --------------------
@@ -260,6 +474,7 @@ agent = create_react_agent(
         - Use the `general_project_info` tool only for questions about general project information, documentation, or high-level overviews.
         - Use the `nl_to_sql_commit_context` tool only for questions that require temporal, aggregated or filtered information about commits, and their authors, message, files and diffs.  
             it returns this fields: (commit_hash, author, "date", message, files, diffs). This tool have the most correct and precise information about commits.
+            If the result says that more rows are available, call it again with the `continuation_token` it returned.
         - Use the `semantic_code` tool to search and explain *current* source code (functions, structures, logic) in the master branch of MuJS.
             It is great for questions like: "What does function X do?" or "How is it implemented the regex function in MuJS?".
             It returns the code snippets and/or explanations about the code and the solution.
@@ -352,11 +567,62 @@ class GraphAgentReact(BaseChatPipeline):
     def __init__(self):
         super().__init__()
         self.graph = agent
+        # one event loop for all the turns: the async Ollama clients keep their connections bound to it
+        self.loop = asyncio.new_event_loop()
 
     def reset(self):
         """Reset the chat history."""
         self.graph.checkpointer = InMemorySaver()  # Reset the checkpointer to clear history
+        super().reset()
+
+    def cache_stats(self) -> dict[str, dict]:
+        return {**super().cache_stats(), "sql": sql_cache.stats()}
+
+    def _remember(self, user_message: str, assistant_reply: str) -> None:
+        # the cached turn is written to the checkpointer as if the agent had answered it
+        self.graph.update_state(config, {"messages": [{"role": "user", "content": user_message},
+                                                      {"role": "assistant", "content": assistant_reply}]},
+                                as_node="agent")
 
     def _respond(self, user_message: str) -> str:
-        res = self.graph.invoke({"messages": [{"role": "user", "content": user_message}]}, config=config)
-        return res["messages"][-1].content
\ No newline at end of file
+        # async invocation, so that the tool calls of the same step run concurrently
+        tool_latencies.reset()
+        tool_tokens.reset()
+        res = self.loop.run_until_complete(
+            self.graph.ainvoke({"messages": [{"role": "user", "content": user_message}]}, config=config)
+        )
+        self._print_tool_metrics()
+        return res["messages"][-1].content
+
+    def _respond_stream(self, user_message: str) -> Iterator[str]:
+        # stream the tokens generated by the agent node (tool outputs are not shown)
+        tool_latencies.reset()
+        tool_tokens.reset()
+        stream = self.graph.astream({"messages": [{"role": "user", "content": user_message}]},
+                                    config=config, stream_mode="messages")
+        tool_steps = set()
+        try:
+            # the async stream is consumed one chunk at a time on the pipeline event loop
+            while True:
+                try:
+                    chunk, metadata = self.loop.run_until_complete(anext(stream))
+                except StopAsyncIteration:
+                    break
+                if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                    continue
+                # the text of a step that calls tools is not part of the answer, from its first tool call chunk
+                # (the models that send the tool calls at the end of the step stream all its text)
+                if chunk.tool_call_chunks:
+                    tool_steps.add(metadata.get("langgraph_step"))
+                if chunk.content and metadata.get("langgraph_step") not in tool_steps:
+                    yield chunk.content
+        finally:
+            # also when the consumer stops early
+            self.loop.run_until_complete(stream.aclose())
+        self._print_tool_metrics()
+
+    def _print_tool_metrics(self):
+        if tool_latencies.calls:
+            print(f"\n[tools] {tool_latencies.format_summary()}")
+        if tool_tokens.calls:
+            print(f"[tokens] {tool_tokens.format_summary()}")
\ No newline at end of file
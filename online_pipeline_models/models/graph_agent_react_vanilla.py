@@ -1,18 +1,20 @@
-import sqlite3
+from typing import Iterator
 
-from langchain_chroma import Chroma
+from langchain_core.messages import AIMessageChunk
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_ollama import ChatOllama
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import create_react_agent
 
 from online_pipeline_models.base_chat_pipeline import BaseChatPipeline
-from utils.config import NUM_CTX, EMBEDDING_MODEL, COMMITS_COLLECTION_NAME, CHROMA_PERSIST_DIR, \
-    GENERAL_DOCS_COLLECTION_NAME, CHROMA_METADATA, SQL_PERSIST_DIR, OFFLINE_MODEL_NAME
+from utils.chroma_registry import get_collection
+from utils.config import NUM_CTX, COMMITS_COLLECTION_NAME, \
+    GENERAL_DOCS_COLLECTION_NAME, SQL_PERSIST_DIR, OFFLINE_MODEL_NAME
+from utils.sqlite_connection import get_connection
 
-# -------------------- LLM & Embeddings --------------------
+# -------------------- LLM --------------------
 llm = ChatOllama(
     model=OFFLINE_MODEL_NAME,
     num_ctx=NUM_CTX,
@@ -26,25 +28,14 @@ llm2 = ChatOllama(
     temperature=0.0
 )
 
-embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
 
 # -------------------- Vector Stores --------------------
 # Commits (summaries, code diffs & messages)
-commit_store = Chroma(
-    collection_name=COMMITS_COLLECTION_NAME,
-    embedding_function=embeddings,
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+commit_store = get_collection(COMMITS_COLLECTION_NAME)
 retriever_commits = commit_store.as_retriever(search_kwargs={"k": 5})
 
 # General documentation
-doc_store = Chroma(
-    collection_name=GENERAL_DOCS_COLLECTION_NAME,
-    embedding_function=embeddings,
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+doc_store = get_collection(GENERAL_DOCS_COLLECTION_NAME)
 retriever_docs = doc_store.as_retriever(search_kwargs={"k": 5})
 
 
@@ -192,8 +183,7 @@ def nl_to_sql_commit_context(question: str) -> str:
         )
 
     try:
-        conn = sqlite3.connect(SQLITE_PATH)
-        cursor = conn.cursor()
+        cursor = get_connection(SQLITE_PATH).cursor()
         cursor.execute(sql_query)
         rows = cursor.fetchall()
         header = [col[0] for col in cursor.description]
@@ -252,7 +242,33 @@ class GraphAgentReactVanilla(BaseChatPipeline):
     def reset(self):
         """Reset the chat history."""
         self.graph.checkpointer = InMemorySaver()  # Reset the checkpointer to clear history
+        super().reset()
+
+    def _remember(self, user_message: str, assistant_reply: str) -> None:
+        # the cached turn is written to the checkpointer as if the agent had answered it
+        self.graph.update_state(config, {"messages": [{"role": "user", "content": user_message},
+                                                      {"role": "assistant", "content": assistant_reply}]},
+                                as_node="agent")
 
     def _respond(self, user_message: str) -> str:
         res = self.graph.invoke({"messages": [{"role": "user", "content": user_message}]}, config=config)
-        return res["messages"][-1].content
\ No newline at end of file
+        return res["messages"][-1].content
+
+    def _respond_stream(self, user_message: str) -> Iterator[str]:
+        # stream the tokens generated by the agent node (tool outputs are not shown)
+        stream = self.graph.stream({"messages": [{"role": "user", "content": user_message}]},
+                                   config=config, stream_mode="messages")
+        tool_steps = set()
+        try:
+            for chunk, metadata in stream:
+                if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                    continue
+                # the text of a step that calls tools is not part of the answer, from its first tool call chunk
+                # (the models that send the tool calls at the end of the step stream all its text)
+                if chunk.tool_call_chunks:
+                    tool_steps.add(metadata.get("langgraph_step"))
+                if chunk.content and metadata.get("langgraph_step") not in tool_steps:
+                    yield chunk.content
+        finally:
+            # also when the consumer stops early
+            stream.close()
\ No newline at end of file
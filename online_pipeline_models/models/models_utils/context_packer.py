@@ -0,0 +1,152 @@
+import re
+
+from utils.config import CONTEXT_TOOL_MAX_TOKENS, CONTEXT_DOC_MAX_TOKENS, CONTEXT_MIN_DOC_TOKENS, \
+    CONTEXT_DEDUP_OVERLAP
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_TERM_RE = re.compile(r"[a-z0-9]\w{2,}")
+# lines shorter than this (braces, `break;`, blank lines) are not considered for deduplication
+_MIN_DEDUP_LINE = 8
+# lines kept before and after a relevant line, for context
+_CONTEXT_LINES = 2
+# first lines of a document always kept (signature of a function, title of a summary)
+_HEAD_LINES = 3
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text, without the tokenizer of the model:
+    punctuation counts one token, words one token every 4 characters (long identifiers are split by the tokenizers).
+    """
+    return sum((len(token) + 3) // 4 for token in _TOKEN_RE.findall(text))
+
+
+def _terms(text: str) -> set[str]:
+    """Returns the words of a text, with the parts of the identifiers (js_pushstring → js_pushstring, pushstring)."""
+    terms = set()
+    for word in _TERM_RE.findall(text.lower()):
+        terms.add(word)
+        terms.update(part for part in word.split("_") if len(part) > 2)
+    return terms
+
+
+def _line_key(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def relevant_lines(query: str, text: str, max_tokens: int) -> str:
+    """
+    Cuts a text to at most `max_tokens` tokens, keeping its first lines and the lines that share the most words
+    with the query (with the lines around them). The omitted lines are replaced by a marker.
+    """
+    lines = text.split("\n")
+    tokens = [count_tokens(line) + 1 for line in lines]    # +1 for the new line
+    if sum(tokens) <= max_tokens:
+        return text
+
+    query_terms = _terms(query)
+    scores = [len(query_terms & _terms(line)) for line in lines]
+    best = sorted((i for i, score in enumerate(scores) if score), key=lambda i: (-scores[i], i))
+
+    # candidates in order of priority: head, relevant lines with their context, then the rest from the top
+    candidates = list(range(min(_HEAD_LINES, len(lines))))
+    for i in best:
+        candidates.extend(range(max(0, i - _CONTEXT_LINES), min(len(lines), i + _CONTEXT_LINES + 1)))
+    candidates.extend(range(len(lines)))
+
+    selected = set()
+    used = 0
+    for i in candidates:
+        if i not in selected and used + tokens[i] <= max_tokens:
+            selected.add(i)
+            used += tokens[i]
+
+    if not selected:
+        # a single line longer than the budget (e.g. a minified table)
+        return f"{text[:4 * max_tokens]} [... truncated ...]"
+
+    out = []
+    skipped = 0
+    for i, line in enumerate(lines):
+        if i in selected:
+            if skipped:
+                out.append(f"[... {skipped} lines omitted ...]")
+                skipped = 0
+            out.append(line)
+        else:
+            skipped += 1
+    if skipped:
+        out.append(f"[... {skipped} lines omitted ...]")
+    return "\n".join(out)
+
+
+class ContextPacker:
+    """
+    Packs the documents returned by an agent tool within a token budget, so that the tool responses don't fill the
+    context of the model (NUM_CTX) and slow down the following steps.
+    The documents are taken in rank order:
+    - a document whose lines were mostly returned already (overlapping chunks, a symbol and the chunk defining it,
+      the same summary twice) is dropped;
+    - a document longer than `max_doc_tokens` is cut to its most relevant lines for the query;
+    - when the budget is exhausted, the remaining documents are omitted.
+    Each document is `header---\\nbody` (as formatted by the tools): only the body is cut.
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_TOOL_MAX_TOKENS, max_doc_tokens: int = CONTEXT_DOC_MAX_TOKENS,
+                 min_doc_tokens: int = CONTEXT_MIN_DOC_TOKENS, dedup_overlap: float = CONTEXT_DEDUP_OVERLAP):
+        self.max_tokens = max_tokens
+        self.max_doc_tokens = max_doc_tokens
+        self.min_doc_tokens = min_doc_tokens
+        self.dedup_overlap = dedup_overlap
+
+    def pack(self, query: str, documents: list[str], separator: str = "\n\n") -> str:
+        """
+        Args:
+            query (str): The query of the tool call, to rank the lines of the long documents.
+            documents (list[str]): The formatted documents, best first.
+            separator (str): The separator of the documents in the response.
+
+        Returns:
+            str: The packed documents.
+        """
+        seen_lines = set()
+        packed = []
+        used = 0
+        duplicates = 0
+        omitted = 0
+
+        for position, document in enumerate(documents):
+            header, marker, body = document.partition("---\n")
+            if not marker:
+                header, body = "", document
+            # only the body: the summaries of a commit share their header (commit, author, date, message)
+            keys = {_line_key(line) for line in body.split("\n") if len(line.strip()) >= _MIN_DEDUP_LINE}
+            if keys and len(keys & seen_lines) >= self.dedup_overlap * len(keys):
+                duplicates += 1
+                continue
+
+            # the first documents can take up to max_doc_tokens, as long as the next ones keep min_doc_tokens each
+            remaining = self.max_tokens - used
+            left = len(documents) - position - 1
+            limit = min(self.max_doc_tokens, max(self.min_doc_tokens, remaining - self.min_doc_tokens * left))
+            header_tokens = count_tokens(header + marker)
+            if remaining < header_tokens + self.min_doc_tokens:
+                omitted += 1
+                continue
+
+            body_limit = max(min(limit, remaining) - header_tokens, self.min_doc_tokens)
+            document = header + marker + relevant_lines(query, body, body_limit)
+
+            packed.append(document)
+            used += count_tokens(document)
+            seen_lines.update(keys)
+
+        result = separator.join(packed)
+        if duplicates or omitted:
+            notes = []
+            if duplicates:
+                notes.append(f"{duplicates} duplicate results removed")
+            if omitted:
+                notes.append(f"{omitted} results omitted (context budget), refine the query to get them")
+            result += f"{separator}[{'; '.join(notes)}]"
+        return result
@@ -1,7 +1,7 @@
 few_shots = [
     (
         "How many commits were made on 2025-05-12?",
-        "SELECT COUNT(*) FROM commits WHERE date = '2025-05-12%';"
+        "SELECT COUNT(*) FROM commits WHERE date >= '2025-05-12' AND date < '2025-05-13';"
     ),
     (
         "List the commit hashes authored by Alice Smith.",
@@ -9,15 +9,15 @@ few_shots = [
     ),
     (
         "Show the latest commit message",
-        "SELECT message FROM commits ORDER BY date LIMIT 1;"
+        "SELECT message FROM commits ORDER BY date DESC LIMIT 1;"
     ),
     (
         "Retrieve the details of the commit with hash ef01dead",
-        "SELECT * FROM commits WHERE commit_hash LIKE '%ef01dead%';"
+        "SELECT * FROM commits WHERE commit_hash LIKE 'ef01dead%';"
     ),
     (
         "Retrieve the commit details for eg01dead",
-        "SELECT * FROM commits WHERE commit_hash LIKE '%eg01dead%';"
+        "SELECT * FROM commits WHERE commit_hash LIKE 'eg01dead%';"
     ),
     (
         "Which author has contributed the highest number of commits?",
@@ -26,19 +26,20 @@ few_shots = [
     ),
     (
         "Give me every distinct date when the commit message mentions 'refactor'.",
-        "SELECT DISTINCT date FROM commits WHERE message LIKE '%refactor%';"
+        "SELECT DISTINCT commits.date FROM commits JOIN commits_fts ON commits_fts.rowid = commits.id "
+        "WHERE commits_fts MATCH 'message:refactor*';"
     ),
     (
         "What files were modified in commit ef01dead?",
-        "SELECT files FROM commits WHERE commit_hash LIKE '%ef01dead%';"
+        "SELECT files FROM commits WHERE commit_hash LIKE 'ef01dead%';"
     ),
     (
         "When was the first commit created?",
-        "SELECT MIN(date) FROM summaries;"
+        "SELECT MIN(date) FROM commits;"
     ),
     (
         "How many commits were made in 2025?",
-        "SELECT COUNT(*) FROM commits WHERE date LIKE '2025%';"
+        "SELECT COUNT(*) FROM commits WHERE date >= '2025-01-01' AND date < '2026-01-01';"
     ),
     (
         "How many commits were done by Alice Smith?",
@@ -46,15 +47,35 @@ few_shots = [
     ),
     (
         "How many times the file `jsarray.c` was modified during the last year?",
-        "SELECT COUNT(*) FROM commits WHERE files LIKE '%jsarray.c%' AND date >= date('now', '-1 year');"
+        "SELECT COUNT(*) FROM commits JOIN commit_files ON commit_files.commit_id = commits.id "
+        "WHERE commit_files.path = 'jsarray.c' AND commits.date >= date('now', '-1 year');"
+    ),
+    (
+        "Which commits changed the function js_pushstring?",
+        "SELECT commits.commit_hash, commits.date, commits.message FROM commits "
+        "JOIN commits_fts ON commits_fts.rowid = commits.id WHERE commits_fts MATCH 'diffs:js_pushstring';"
+    ),
+    (
+        "Which commits touched regexp.c?",
+        "SELECT commits.commit_hash, commits.date, commits.message FROM commits "
+        "JOIN commit_files ON commit_files.commit_id = commits.id WHERE commit_files.path = 'regexp.c';"
+    ),
+    (
+        "Which files changed the most in 2024?",
+        "SELECT commit_files.path, SUM(lines_added + lines_removed) AS churn FROM commit_files "
+        "JOIN commits ON commits.id = commit_files.commit_id "
+        "WHERE commits.date >= '2024-01-01' AND commits.date < '2025-01-01' "
+        "GROUP BY commit_files.path ORDER BY churn DESC LIMIT 10;"
     ),
     (
         "When the file `jsarray.c` was added to the project?",
-        "SELECT date FROM commits WHERE files LIKE '%jsarray.c%' ORDER BY date LIMIT 1;"
+        "SELECT commits.date FROM commits JOIN commit_files ON commit_files.commit_id = commits.id "
+        "WHERE commit_files.path = 'jsarray.c' ORDER BY commits.date LIMIT 1;"
     ),
     (
         "Retrieve me the commit where the issue #123 was fixed.",
-        "SELECT * FROM commits WHERE message LIKE '%issue%123%' OR message LIKE '%fixes%123%' OR message LIKE '%resolved%123%';"
+        "SELECT commits.* FROM commits JOIN commits_fts ON commits_fts.rowid = commits.id "
+        "WHERE commits_fts MATCH 'message:\"issue 123\" OR message:\"fixes 123\" OR message:\"resolved 123\"';"
     )
 ]
 
@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+import time
+
+from utils.config import NL2SQL_CACHE_PATH, NL2SQL_CACHE_MAX_ENTRIES
+from utils.llm_utils import normalize_question
+from utils.sqlite_connection import get_connection
+
+# Literals of a question that can change without changing the shape of its SQL query
+_LITERAL_PATTERNS = [
+    ("quoted", r"['\"`][^'\"`]+['\"`]"),
+    ("date", r"\b\d{4}-\d{2}-\d{2}\b"),
+    ("hash", r"\b(?=[0-9a-f]*\d)[0-9a-f]{7,40}\b"),
+    ("file", r"\b[\w-]+\.(?:c|h|md|html|txt|js|py)\b"),
+]
+_LITERAL_RE = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in _LITERAL_PATTERNS), re.IGNORECASE)
+# Literals left in a SQL template after the parameterization (e.g. the end of a date range), which are
+# derived from the question and would be wrong for a question with different literals
+_DERIVED_LITERAL_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b|\b(?=[0-9a-f]*\d)[0-9a-f]{7,40}\b")
+# SQL string literals ('...' with '' escapes), the only places where the literals of the question are replaced
+_SQL_STRING_RE = re.compile(r"('(?:[^']|'')*')")
+
+
+def _strip_quotes(kind: str, text: str) -> str:
+    return text[1:-1] if kind == "quoted" else text
+
+
+def _parameterize_sql(sql_query: str, literals: list[str]) -> str | None:
+    """
+    Replaces the literals of a question with `<<i>>` placeholders inside the string literals of its SQL query
+    (values, LIKE patterns, MATCH expressions), with an exact match.
+    Returns None if a literal is missing from the strings, or also appears outside them (e.g. a literal `date`
+    matching the column name), since the query couldn't be reused with other literals.
+    """
+    # odd parts are the string literals
+    parts = _SQL_STRING_RE.split(sql_query)
+    # the longest literals first, so that a literal contained in another one doesn't break it
+    for i, literal in sorted(enumerate(literals), key=lambda item: -len(item[1])):
+        if any(literal in part for part in parts[0::2]):
+            return None
+        escaped = literal.replace("'", "''")
+        count = 0
+        for j in range(1, len(parts), 2):
+            count += parts[j].count(escaped)
+            parts[j] = parts[j].replace(escaped, f"<<{i}>>")
+        if count == 0:
+            return None
+    return "".join(parts)
+
+
+def parameterize_question(question: str) -> tuple[str, list[str]]:
+    """
+    Replaces the literals of a question (quoted strings, dates, commit hashes, file names) with placeholders.
+
+    Returns:
+        tuple: The normalized question with the placeholders (e.g. `details of commit <hash0>`) and the literals.
+    """
+    literals = []
+
+    def _replace(m):
+        kind = m.lastgroup
+        literals.append(_strip_quotes(kind, m.group(kind)))
+        return f"<{kind}{len(literals) - 1}>"
+
+    return normalize_question(_LITERAL_RE.sub(_replace, question)), literals
+
+
+class SQLTranslationCache:
+    """
+    Persistent SQLite cache of the SQL queries generated by the LLM, keyed on the parameterized question:
+    a question with the same shape of a cached one, but different literals, reuses its query with the new literals.
+    A query is cached only if every literal of the question appears in it and no other literal derived from them
+    (e.g. the next day of a date range) is left, so that the substitution is always correct.
+    The callers cache only the queries that returned rows, and evict the cached queries that fail.
+    When the cache exceeds `max_entries`, the least recently used queries are evicted.
+    """
+
+    def __init__(self, db_path: str = NL2SQL_CACHE_PATH, max_entries: int = NL2SQL_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = get_connection(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS nl2sql_cache (
+                question_key TEXT PRIMARY KEY,
+                sql_template TEXT,
+                last_access REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_nl2sql_cache_last_access ON nl2sql_cache (last_access)")
+        conn.commit()
+
+    def get(self, question: str) -> str | None:
+        """
+        Returns the cached SQL query of the question, with its literals, or None.
+        """
+        key, literals = parameterize_question(question)
+        conn = get_connection(self.db_path)
+        row = conn.execute("SELECT sql_template FROM nl2sql_cache WHERE question_key = ?", (key,)).fetchone()
+
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        conn.execute("UPDATE nl2sql_cache SET last_access = ? WHERE question_key = ?", (time.time(), key))
+        conn.commit()
+
+        sql_query = row[0]
+        for i, literal in enumerate(literals):
+            sql_query = sql_query.replace(f"<<{i}>>", literal.replace("'", "''"))
+        return sql_query
+
+    def put(self, question: str, sql_query: str) -> bool:
+        """
+        Caches the SQL query generated for the question, if it can be parameterized.
+
+        Returns:
+            bool: True if the query was cached.
+        """
+        key, literals = parameterize_question(question)
+
+        sql_template = _parameterize_sql(sql_query, literals)
+        if sql_template is None or _DERIVED_LITERAL_RE.search(sql_template):
+            return False
+
+        conn = get_connection(self.db_path)
+        conn.execute(
+            "INSERT OR REPLACE INTO nl2sql_cache (question_key, sql_template, last_access) VALUES (?, ?, ?)",
+            (key, sql_template, time.time())
+        )
+
+        # size-based eviction of the least recently used queries
+        excess = conn.execute("SELECT COUNT(*) FROM nl2sql_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM nl2sql_cache WHERE rowid IN (SELECT rowid FROM nl2sql_cache ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+
+        conn.commit()
+        return True
+
+    def evict(self, question: str) -> None:
+        """
+        Removes the cached SQL query of the question (e.g. because it failed).
+        """
+        key, _ = parameterize_question(question)
+        conn = get_connection(self.db_path)
+        conn.execute("DELETE FROM nl2sql_cache WHERE question_key = ?", (key,))
+        conn.commit()
+
+    def stats(self) -> dict:
+        """Returns the number of questions whose SQL query was found in the cache or not, since the start."""
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
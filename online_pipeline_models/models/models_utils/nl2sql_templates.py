@@ -0,0 +1,164 @@
+import datetime
+import re
+
+from utils.llm_utils import normalize_question
+
+# Rule-based translation of the recurring question shapes of `graph_agent_react_nl2sql_examples`,
+# so that they skip the LLM. Each template matches the whole normalized question and returns a
+# parameterized SELECT (the literals of the question are never pasted into the SQL).
+
+_PREFIX = r"(?:please |can you |could you )?(?:show(?: me)? |tell me |give me |retrieve(?: me)? |list |what is |what's )?"
+_HASH = r"(?P<hash>[0-9a-f]{7,40})"
+_DATE = r"(?P<date>\d{4}-\d{2}-\d{2})"
+_YEAR = r"(?P<year>(?:19|20)\d{2})"
+_FILE = r"(?:the file )?`?(?P<file>[\w./-]+\.\w+|makefile)`?"
+# Words that can't be part of an author name: a question with them (e.g. "by alice last year", "by the author alice")
+# doesn't match the templates and is left to the LLM
+_NOT_NAME = (r"(?!(?:the|a|an|author|user|developer|contributor|and|or|in|on|at|of|from|to|during|since|until|before|"
+             r"after|last|this|next|past|previous|current|year|years|month|months|week|weeks|day|days|today|"
+             r"yesterday|ago|recently|ever|total)\b)")
+_AUTHOR = rf"(?P<author>{_NOT_NAME}[a-z][\w'-]*(?: {_NOT_NAME}[a-z][\w'-]*){{0,3}})"
+
+_COMMIT_COLUMNS = "commits.commit_hash, commits.date, commits.message"
+
+
+def _day_range(day: str) -> tuple[str, str]:
+    start = datetime.date.fromisoformat(day)
+    return start.isoformat(), (start + datetime.timedelta(days=1)).isoformat()
+
+
+def _year_range(year: str) -> tuple[str, str]:
+    return f"{year}-01-01", f"{int(year) + 1}-01-01"
+
+
+def _author_condition(author: str, column: str = "author") -> tuple[str, list]:
+    # Alice Smith → author LIKE '%Alice%Smith%' OR author LIKE '%Smith%Alice%'
+    words = author.split()
+    patterns = ["%" + "%".join(words) + "%"]
+    if len(words) > 1:
+        patterns.append("%" + "%".join(reversed(words)) + "%")
+    return "(" + " OR ".join(f"{column} LIKE ?" for _ in patterns) + ")", patterns
+
+
+def _count_by_day(m):
+    return "SELECT COUNT(*) FROM commits WHERE date >= ? AND date < ?;", list(_day_range(m["date"]))
+
+
+def _count_by_year(m):
+    return "SELECT COUNT(*) FROM commits WHERE date >= ? AND date < ?;", list(_year_range(m["year"]))
+
+
+def _count_all(m):
+    return "SELECT COUNT(*) FROM commits;", []
+
+
+def _commits_by_day(m):
+    return "SELECT * FROM commits WHERE date >= ? AND date < ?;", list(_day_range(m["date"]))
+
+
+def _count_by_author(m):
+    condition, params = _author_condition(m["author"])
+    if m["year"]:
+        return (f"SELECT COUNT(*) FROM commits WHERE {condition} AND date >= ? AND date < ?;",
+                params + list(_year_range(m["year"])))
+    return f"SELECT COUNT(*) FROM commits WHERE {condition};", params
+
+
+def _hashes_by_author(m):
+    condition, params = _author_condition(m["author"])
+    return f"SELECT commit_hash FROM commits WHERE {condition};", params
+
+
+def _commit_details(m):
+    # the pattern is bound whole, so that SQLite can use the NOCASE index of commit_hash for the prefix
+    return "SELECT * FROM commits WHERE commit_hash LIKE ?;", [m["hash"] + "%"]
+
+
+def _commit_files(m):
+    return "SELECT files FROM commits WHERE commit_hash LIKE ?;", [m["hash"] + "%"]
+
+
+def _latest_commit(m):
+    column = "message" if m["message"] else "*"
+    return f"SELECT {column} FROM commits ORDER BY date DESC LIMIT 1;", []
+
+
+def _first_commit(m):
+    return "SELECT * FROM commits ORDER BY date LIMIT 1;", []
+
+
+def _first_commit_date(m):
+    return "SELECT MIN(date) FROM commits;", []
+
+
+def _top_author(m):
+    return "SELECT author, COUNT(*) AS cnt FROM commits GROUP BY author ORDER BY cnt DESC LIMIT 1;", []
+
+
+def _commits_touching_file(m):
+    return (f"SELECT {_COMMIT_COLUMNS} FROM commits JOIN commit_files ON commit_files.commit_id = commits.id "
+            "WHERE commit_files.path = ? ORDER BY commits.date;", [m["file"]])
+
+
+def _file_modification_count(m):
+    return ("SELECT COUNT(*) FROM commits JOIN commit_files ON commit_files.commit_id = commits.id "
+            "WHERE commit_files.path = ?;", [m["file"]])
+
+
+def _file_added(m):
+    return ("SELECT commits.date FROM commits JOIN commit_files ON commit_files.commit_id = commits.id "
+            "WHERE commit_files.path = ? ORDER BY commits.date LIMIT 1;", [m["file"]])
+
+
+def _files_changed_most(m):
+    return ("SELECT commit_files.path, SUM(lines_added + lines_removed) AS churn FROM commit_files "
+            "JOIN commits ON commits.id = commit_files.commit_id "
+            "WHERE commits.date >= ? AND commits.date < ? "
+            "GROUP BY commit_files.path ORDER BY churn DESC LIMIT 10;", list(_year_range(m["year"])))
+
+
+SQL_TEMPLATES = [
+    (rf"how many commits (?:were )?(?:made |done |created |pushed )?on {_DATE}", _count_by_day),
+    (rf"how many commits (?:were )?(?:made |done |created |pushed )?in {_YEAR}", _count_by_year),
+    (r"how many commits (?:are there|were made|have been made|does the project have)(?: in total)?"
+     r"|how many commits in total", _count_all),
+    (rf"how many commits (?:were )?(?:made |done |authored |pushed )?by {_AUTHOR}(?: in {_YEAR})?",
+     _count_by_author),
+    (rf"{_PREFIX}the commit hashes authored by {_AUTHOR}", _hashes_by_author),
+    (rf"{_PREFIX}(?:the )?(?:details of )?(?:the )?commits? (?:made )?on {_DATE}", _commits_by_day),
+    (rf"{_PREFIX}(?:the )?(?:commit )?details (?:of|for) (?:the )?(?:commit )?(?:with hash )?{_HASH}", _commit_details),
+    (rf"{_PREFIX}(?:the )?commit (?:with hash )?{_HASH}", _commit_details),
+    (rf"what changed in (?:the )?commit (?:with hash )?{_HASH}", _commit_details),
+    (rf"(?:what|which) files (?:were|are) (?:modified|changed|touched) (?:in|by) (?:the )?commit (?:with hash )?{_HASH}",
+     _commit_files),
+    (rf"{_PREFIX}the (?:latest|last|most recent) commit(?P<message> message)?", _latest_commit),
+    (rf"{_PREFIX}the first commit", _first_commit),
+    (r"when was the first commit (?:created|made|done)", _first_commit_date),
+    (r"which author has (?:contributed|made) the (?:highest number of|most) commits"
+     r"|who (?:is the author with|made|has) the most commits", _top_author),
+    (rf"which commits (?:touched|changed|modified) {_FILE}", _commits_touching_file),
+    (rf"how many (?:times|commits) (?:was |were |has )?{_FILE} (?:been )?(?:modified|changed|touched)",
+     _file_modification_count),
+    (rf"when (?:was )?{_FILE} (?:was )?(?:added|created)(?: to the project)?", _file_added),
+    (rf"which files changed the most in {_YEAR}", _files_changed_most),
+]
+
+_COMPILED_TEMPLATES = [(re.compile(pattern), build) for pattern, build in SQL_TEMPLATES]
+
+
+def match_sql_template(question: str) -> tuple[str, list] | None:
+    """
+    Translates a question into SQL with the first template matching the whole (normalized) question.
+
+    Args:
+        question (str): The natural-language question.
+
+    Returns:
+        tuple | None: The SQL query and its parameters, or None if no template matches.
+    """
+    normalized = normalize_question(question)
+    for pattern, build in _COMPILED_TEMPLATES:
+        m = pattern.fullmatch(normalized)
+        if m:
+            return build(m)
+    return None
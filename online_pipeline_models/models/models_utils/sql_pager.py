@@ -0,0 +1,88 @@
+import secrets
+import threading
+from collections import OrderedDict
+
+from utils.config import SQL_TOOL_MAX_ROWS, SQL_TOOL_MAX_CHARS, SQL_TOOL_MAX_CELL_CHARS
+from utils.sqlite_connection import get_connection
+
+
+def truncate_cell(value, max_chars: int = SQL_TOOL_MAX_CELL_CHARS) -> str:
+    """Converts a value to string, truncating it to `max_chars` characters."""
+    text = str(value)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}… [+{len(text) - max_chars} chars]"
+
+
+class SQLResultPager:
+    """
+    Runs the SELECTs of the SQL tool one page at a time, so that a tool response never exceeds
+    `max_rows` rows or `max_chars` characters, whatever the query (e.g. `SELECT * FROM commits` with all the diffs).
+    The query is wrapped with a LIMIT/OFFSET, the long values are truncated to `max_cell_chars`, and when more rows
+    are available a short continuation token is returned, which resumes the query from the next row.
+    """
+
+    def __init__(self, db_path: str, max_rows: int = SQL_TOOL_MAX_ROWS, max_chars: int = SQL_TOOL_MAX_CHARS,
+                 max_cell_chars: int = SQL_TOOL_MAX_CELL_CHARS, max_tokens: int = 100):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_chars = max_chars
+        self.max_cell_chars = max_cell_chars
+        self.max_tokens = max_tokens
+        # continuation token → (query, parameters, offset of the next page)
+        self.tokens: OrderedDict[str, tuple[str, tuple, int]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def fetch(self, sql_query: str, params=(), offset: int = 0) -> tuple[list[str], list[str], str | None]:
+        """
+        Runs a page of the query.
+
+        Args:
+            sql_query (str): The SELECT query.
+            params: The parameters of the query.
+            offset (int): The first row of the page.
+
+        Returns:
+            tuple: The header, the formatted rows of the page and the continuation token (None on the last page).
+        """
+        query = sql_query.strip().rstrip(";")
+        cursor = get_connection(self.db_path).cursor()
+        # one more row than the page, to know if there is a next page
+        # (new lines around the query, so that a final comment doesn't hide the closing parenthesis)
+        cursor.execute(f"SELECT * FROM (\n{query}\n) LIMIT ? OFFSET ?", (*params, self.max_rows + 1, offset))
+        rows = cursor.fetchall()
+        header = [col[0] for col in cursor.description]
+
+        formatted_rows = []
+        size = 0
+        for row in rows[:self.max_rows]:
+            formatted_row = ", ".join(truncate_cell(value, self.max_cell_chars) for value in row)
+            # at least one row per page, even if longer than the limit
+            if formatted_rows and size + len(formatted_row) > self.max_chars:
+                break
+            formatted_rows.append(formatted_row)
+            size += len(formatted_row) + 1
+
+        token = None
+        if len(rows) > len(formatted_rows):
+            token = self._new_token(query, tuple(params), offset + len(formatted_rows))
+        return header, formatted_rows, token
+
+    def resume(self, token: str) -> tuple[str, tuple, int]:
+        """
+        Returns the query, the parameters and the offset of the page of a continuation token.
+
+        Raises:
+            KeyError: If the token is unknown or expired.
+        """
+        with self.lock:
+            return self.tokens[token.strip().strip("\"'`")]
+
+    def _new_token(self, query: str, params: tuple, offset: int) -> str:
+        token = secrets.token_hex(4)
+        with self.lock:
+            self.tokens[token] = (query, params, offset)
+            # only the most recent tokens are kept
+            while len(self.tokens) > self.max_tokens:
+                self.tokens.popitem(last=False)
+        return token
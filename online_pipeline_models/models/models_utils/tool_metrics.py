@@ -0,0 +1,107 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ToolLatencyRecorder:
+    """
+    Records the execution time of the agent tools during a turn.
+    Tools of the same step may run concurrently (in threads or as asyncio tasks), so the calls are recorded under a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: list[tuple[str, float]] = []
+
+    @contextmanager
+    def measure(self, tool_name: str):
+        """Measures the wall-clock time of the enclosed tool call."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(tool_name, time.perf_counter() - start)
+
+    def record(self, tool_name: str, seconds: float) -> None:
+        with self.lock:
+            self.calls.append((tool_name, seconds))
+
+    def reset(self) -> None:
+        """Clears the calls recorded, at the beginning of a new turn."""
+        with self.lock:
+            self.calls.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Returns, for each tool called, the number of calls, the total and the maximum latency in seconds.
+        """
+        with self.lock:
+            calls = list(self.calls)
+
+        summary = {}
+        for tool_name, seconds in calls:
+            stats = summary.setdefault(tool_name, {"calls": 0, "total": 0.0, "max": 0.0})
+            stats["calls"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+        return summary
+
+    def format_summary(self) -> str:
+        """Returns the summary as a single line, e.g. `commit_code 1x 0.84s | semantic_code 2x 1.20s (max 0.71s)`."""
+        parts = []
+        for tool_name, stats in self.summary().items():
+            part = f"{tool_name} {stats['calls']}x {stats['total']:.2f}s"
+            if stats["calls"] > 1:
+                part += f" (max {stats['max']:.2f}s)"
+            parts.append(part)
+        return " | ".join(parts)
+
+
+class ToolTokenRecorder:
+    """
+    Records the tokens returned by the agent tools during a turn: the tokens of the documents retrieved
+    and the tokens actually returned to the model once packed in the context budget.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: list[tuple[str, int, int]] = []
+
+    def record(self, tool_name: str, retrieved: int, returned: int) -> None:
+        with self.lock:
+            self.calls.append((tool_name, retrieved, returned))
+
+    def reset(self) -> None:
+        """Clears the calls recorded, at the beginning of a new turn."""
+        with self.lock:
+            self.calls.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Returns, for each tool called, the number of calls and the tokens retrieved and returned.
+        """
+        with self.lock:
+            calls = list(self.calls)
+
+        summary = {}
+        for tool_name, retrieved, returned in calls:
+            stats = summary.setdefault(tool_name, {"calls": 0, "retrieved": 0, "returned": 0})
+            stats["calls"] += 1
+            stats["retrieved"] += retrieved
+            stats["returned"] += returned
+        return summary
+
+    def format_summary(self) -> str:
+        """
+        Returns the summary as a single line, e.g. `commit_code 1x 3950 tokens (of 11200) | total 3950 tokens`.
+        """
+        parts = []
+        total = 0
+        for tool_name, stats in self.summary().items():
+            part = f"{tool_name} {stats['calls']}x {stats['returned']} tokens"
+            if stats["retrieved"] > stats["returned"]:
+                part += f" (of {stats['retrieved']})"
+            parts.append(part)
+            total += stats["returned"]
+        parts.append(f"total {total} tokens")
+        return " | ".join(parts)
@@ -1,19 +1,31 @@
-from online_pipeline_models.models.chain_agent_react import ChainAgentReact
-from online_pipeline_models.models.chain_multi_query import ChainMultiQuery
-from online_pipeline_models.models.chain_simple import ChainSimple
-from online_pipeline_models.models.graph_agent_react import GraphAgentReact
-from online_pipeline_models.models.graph_agent_react_vanilla import GraphAgentReactVanilla
+import importlib
+import time
 
+# Pipelines are imported only when selected: each model module builds its LLMs, stores and agents at import time
 REGISTRY = {
-    "simple": ChainSimple,
-    "multi_query": ChainMultiQuery,
-    "chain_agent_react": ChainAgentReact,
-    "graph_agent_react": GraphAgentReact,                       # final model
-    "graph_agent_react_vanilla": GraphAgentReactVanilla,        # Vanilla version of GraphAgentReact, for testing references
+    "simple": ("online_pipeline_models.models.chain_simple", "ChainSimple"),
+    "multi_query": ("online_pipeline_models.models.chain_multi_query", "ChainMultiQuery"),
+    "chain_agent_react": ("online_pipeline_models.models.chain_agent_react", "ChainAgentReact"),
+    "graph_agent_react": ("online_pipeline_models.models.graph_agent_react", "GraphAgentReact"),    # final model
+    "graph_agent_react_vanilla": ("online_pipeline_models.models.graph_agent_react_vanilla",
+                                  "GraphAgentReactVanilla"),     # Vanilla version of GraphAgentReact, for testing references
 }
 
+_pipelines = {}
+
 def get_chat_pipeline(name: str):
     try:
-        return REGISTRY[name]()
+        module_name, class_name = REGISTRY[name]
     except KeyError:
-        raise ValueError(f"Pipeline '{name}' non valida. Scegli tra {list(REGISTRY)})")
\ No newline at end of file
+        raise ValueError(f"Pipeline '{name}' non valida. Scegli tra {list(REGISTRY)})")
+
+    # the pipeline is built on first use and reused afterwards
+    if name not in _pipelines:
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        imported = time.perf_counter()
+        _pipelines[name] = getattr(module, class_name)()
+        built = time.perf_counter()
+        print(f"[{name}] startup: {built - start:.2f}s (import {imported - start:.2f}s, init {built - imported:.2f}s)")
+
+    return _pipelines[name]
@@ -2,7 +2,7 @@ import logging
 
 from langchain_core.documents import Document
 
-from utils.chromadb_utils import format_retrieved_docs, retrieve_top_commits_by_summary_type
+from utils.chromadb_utils import format_retrieved_docs, retrieve_top_commits_by_summary_type, embed_retrieval_query
 from utils.config import SEED
 from utils.enums import SummaryType
 from utils.llm_utils import clean_text_paragraph
@@ -146,7 +146,8 @@ def ask_model_summarization(prompt, ollama_client, model):
     answer = response['response'].split("Answer:")[-1]
     return answer
 
-def generate_general_summary(commit, idx, llama_model, ollama_client) -> list[tuple[Document, float]]:
+def generate_general_summary(commit, idx, llama_model, ollama_client, query_embedding=None, max_retrieved_index=None) \
+        -> list[tuple[Document, float]]:
     """
     Generate a general summary for a git commit using the LLM.
     This function retrieves similar commits from the database and uses them to enhance the summary generation.
@@ -156,6 +157,8 @@ def generate_general_summary(commit, idx, llama_model, ollama_client) -> list[tu
         idx (int): The index of the commit in the dataset.
         llama_model (str): The name of the LLM model to use for summarization.
         ollama_client: The Ollama client instance for interacting with the model.
+        query_embedding (list[float], optional): The embedding of the commit retrieval query, computed if not given.
+        max_retrieved_index (int, optional): The newest commit index that can be retrieved, all if not given.
 
     Returns:
         list[tuple[Document, float]]: A list of tuples containing retrieved documents and their relevance scores.
@@ -163,8 +166,11 @@ def generate_general_summary(commit, idx, llama_model, ollama_client) -> list[tu
 
     logger.debug(f"Summarizing (General) commit {idx}")
     prompt = generate_prompt_summarization_few_shots(commit)
+    if query_embedding is None:
+        query_embedding = embed_retrieval_query(commit)
     summary_retrieved_docs: list[tuple[Document, float]] = (
-        retrieve_top_commits_by_summary_type(prompt, SummaryType.GENERAL, n_results=3))
+        retrieve_top_commits_by_summary_type(query_embedding, SummaryType.GENERAL, n_results=3,
+                                             max_index=max_retrieved_index))
 
     if summary_retrieved_docs:
         logger.debug(
@@ -1,10 +1,12 @@
 import logging
 import re
+import time
 
 from langchain_core.documents import Document
 
-from utils.chromadb_utils import format_retrieved_docs, retrieve_top_commits_by_summary_type
-from utils.config import SEED
+from utils.chromadb_utils import format_retrieved_docs, retrieve_top_commits_by_summary_type, embed_retrieval_query
+from utils.config import SEED, TECH_SUMMARY_MARK_THRESHOLD, TECH_SUMMARY_MAX_ITERATIONS, TECH_SUMMARY_MAX_TOKENS, \
+    TECH_SUMMARY_MAX_SECONDS, TECH_SUMMARY_PATIENCE
 from utils.enums import SummaryType
 from utils.llm_utils import clean_text_paragraph
 
@@ -177,7 +179,7 @@ def generate_quality_assurance_prompt(technical_summary, diffs) -> str:
     return prompt
 
 
-def ask_model_technical_analysis(prompt, ollama_client, model) -> str:
+def ask_model_technical_analysis(prompt, ollama_client, model, stats=None) -> str:
     """
     Ask the Ollama model to perform technical analysis on a commit.
 
@@ -185,6 +187,7 @@ def ask_model_technical_analysis(prompt, ollama_client, model) -> str:
         prompt (str): The input prompt for the model.
         ollama_client: The Ollama client instance.
         model (str): The model name to use (e.g., "llama3").
+        stats (dict, optional): If given, the generated tokens are added to its "tokens" counter.
 
     Returns:
         str: The technical analysis response from the model.
@@ -198,12 +201,14 @@ def ask_model_technical_analysis(prompt, ollama_client, model) -> str:
             "top_p": None,
         }
     )
+    if stats is not None:
+        stats["tokens"] += response.get('eval_count', 0) or 0
 
     answer = response['response'].split("Summary of Changes:")[-1]
     return answer.strip()
 
 
-def ask_model_quality_assurance(prompt, ollama_client, model) -> tuple[str, str]:
+def ask_model_quality_assurance(prompt, ollama_client, model, stats=None) -> tuple[str, str]:
     """
     Ask the Ollama model to perform quality assurance on the technical summary.
     This function evaluates the technical summary and provides a mark and improvement suggestions.
@@ -212,6 +217,7 @@ def ask_model_quality_assurance(prompt, ollama_client, model) -> tuple[str, str]
         prompt (str): The input prompt for the model.
         ollama_client: The Ollama client instance.
         model (str): The model name to use (e.g., "llama3").
+        stats (dict, optional): If given, the generated tokens are added to its "tokens" counter.
 
     Returns:
         tuple: A tuple containing the mark (int) and improvement suggestions (str).
@@ -225,6 +231,8 @@ def ask_model_quality_assurance(prompt, ollama_client, model) -> tuple[str, str]
             "top_p": None,  # Nucleus sampling: no restriction
             "seed": SEED,
         })
+    if stats is not None:
+        stats["tokens"] += response.get('eval_count', 0) or 0
     answer = response['response'].split("Answer:")[-1]
 
     # Extract decision (True/False) and improvement suggestions (comment)
@@ -250,17 +258,31 @@ def ask_model_quality_assurance(prompt, ollama_client, model) -> tuple[str, str]
     return str(mark), improvement_suggestions
 
 
-def generate_technical_report(commit, idx, llama_model, ollama_client, retrieved_docs) -> str:
-    mark_qa = -1
+def generate_technical_report(commit, idx, llama_model, ollama_client, retrieved_docs,
+                              threshold=TECH_SUMMARY_MARK_THRESHOLD,
+                              max_iterations=TECH_SUMMARY_MAX_ITERATIONS,
+                              max_tokens=TECH_SUMMARY_MAX_TOKENS,
+                              max_seconds=TECH_SUMMARY_MAX_SECONDS,
+                              patience=TECH_SUMMARY_PATIENCE) -> tuple[str, dict]:
+    """
+    Generate the technical summary of a commit, refining it with the QA feedback until its mark reaches the threshold.
+    The loop also stops when the budget (iterations, generated tokens, wall-clock seconds) is exhausted
+    or when the mark doesn't improve for `patience` iterations. The best scored draft is returned.
+
+    Returns:
+        tuple: The best technical summary and the stats of the loop (iterations, tokens, seconds, best mark, stop reason).
+    """
     improvements = None
-    technical_summary = None
-    threshold = 8 # todo: maybe return to 9 for the final version
-    iteration_number = 1
-    iteration_limit = 10
+    best_summary = None
+    best_mark = -1
+    iterations_without_improvement = 0
+    stop_reason = "max_iterations"
+    stats = {"iterations": 0, "tokens": 0}
+    start = time.monotonic()
 
-    while int(mark_qa) < threshold and iteration_number <= iteration_limit:
-        logger.debug(f"Generating technical summary for commit {idx}, iteration {iteration_number}")
-        iteration_number += 1
+    while stats["iterations"] < max_iterations:
+        stats["iterations"] += 1
+        logger.debug(f"Generating technical summary for commit {idx}, iteration {stats['iterations']}")
 
         prompt = generate_prompt_technical_analysis(commit, improvements)
         if retrieved_docs:
@@ -273,23 +295,48 @@ def generate_technical_report(commit, idx, llama_model, ollama_client, retrieved
                 f"{context_docs}\n"
             )
 
-        technical_summary = ask_model_technical_analysis(prompt, ollama_client, llama_model)
+        technical_summary = ask_model_technical_analysis(prompt, ollama_client, llama_model, stats)
 
         qa_prompt = generate_quality_assurance_prompt(technical_summary, commit['diffs'])
-        mark_qa, improvements = ask_model_quality_assurance(qa_prompt, ollama_client, llama_model)
+        mark_qa, improvements = ask_model_quality_assurance(qa_prompt, ollama_client, llama_model, stats)
+        mark_qa = int(mark_qa)
 
-        # print(f"Mark: {mark_qa}")
-        # print(f"Improvement suggestions: {improvements}")
         logger.debug(f"Mark: {mark_qa}")
 
-    return technical_summary
-
-
-def generate_technical_summary(commit, idx, llama_model, ollama_client) -> list[tuple[Document, float]]:
+        # keep the best scored draft
+        if best_summary is None or mark_qa > best_mark:
+            best_summary, best_mark = technical_summary, mark_qa
+            iterations_without_improvement = 0
+        else:
+            iterations_without_improvement += 1
+
+        if best_mark >= threshold:
+            stop_reason = "threshold"
+            break
+        if iterations_without_improvement >= patience:
+            stop_reason = "converged"
+            break
+        if max_tokens is not None and stats["tokens"] >= max_tokens:
+            stop_reason = "max_tokens"
+            break
+        if max_seconds is not None and time.monotonic() - start >= max_seconds:
+            stop_reason = "max_seconds"
+            break
+
+    stats.update({"seconds": round(time.monotonic() - start, 2), "best_mark": best_mark, "stop_reason": stop_reason})
+    logger.debug(f"Technical summary stats for commit {idx}: {stats}")
+    return best_summary, stats
+
+
+def generate_technical_summary(commit, idx, llama_model, ollama_client, query_embedding=None, max_retrieved_index=None) \
+        -> list[tuple[Document, float]]:
     logger.debug(f"Summarizing (General) commit {idx}")
     prompt = generate_prompt_technical_analysis(commit)
+    if query_embedding is None:
+        query_embedding = embed_retrieval_query(commit)
     tech_summary_retrieved_docs = (
-        retrieve_top_commits_by_summary_type(prompt, SummaryType.TECHNICAL, n_results=3, threshold=0.74))
+        retrieve_top_commits_by_summary_type(query_embedding, SummaryType.TECHNICAL, n_results=3, threshold=0.74,
+                                             max_index=max_retrieved_index))
 
     if tech_summary_retrieved_docs:
         logger.debug(
@@ -304,5 +351,6 @@ def generate_technical_summary(commit, idx, llama_model, ollama_client) -> list[
     else:
         logger.debug(f"No similar commits found for commit {idx}")
 
-    commit['llama_tech_summary'] = generate_technical_report(commit, idx, llama_model, ollama_client, tech_summary_retrieved_docs)
+    commit['llama_tech_summary'], commit['llama_tech_summary_stats'] = (
+        generate_technical_report(commit, idx, llama_model, ollama_client, tech_summary_retrieved_docs))
     return tech_summary_retrieved_docs
@@ -0,0 +1,45 @@
+import threading
+
+import chromadb
+from langchain_chroma import Chroma
+
+from utils.config import CHROMA_PERSIST_DIR, CHROMA_METADATA
+from utils.embedding_cache import get_embeddings
+
+# Process-wide Chroma client and collection handles, shared by the offline utilities and the online models
+_client = None
+_collections: dict[str, Chroma] = {}
+_lock = threading.RLock()
+
+
+def get_chroma_client() -> chromadb.ClientAPI:
+    """
+    Returns the persistent Chroma client, opening it on first use.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        return _client
+
+
+def get_collection(name: str) -> Chroma:
+    """
+    Returns the handle of a Chroma collection (e.g. COMMITS_COLLECTION_NAME, GENERAL_DOCS_COLLECTION_NAME,
+    SEMANTIC_CODE_COLLECTION), creating it on first use with the shared client and embedding function.
+
+    Args:
+        name (str): The name of the collection.
+
+    Returns:
+        Chroma: The collection handle.
+    """
+    with _lock:
+        if name not in _collections:
+            _collections[name] = Chroma(
+                collection_name=name,
+                embedding_function=get_embeddings(),
+                collection_metadata=CHROMA_METADATA,
+                client=get_chroma_client(),
+            )
+        return _collections[name]
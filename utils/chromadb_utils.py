@@ -1,28 +1,68 @@
 import datetime
+import threading
+import time
 
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_ollama import OllamaEmbeddings
 
-from utils.config import EMBEDDING_MODEL, CHROMA_PERSIST_DIR, COMMITS_COLLECTION_NAME, CHROMA_METADATA, \
-    GENERAL_DOCS_COLLECTION_NAME
+from utils.chroma_registry import get_collection
+from utils.config import COMMITS_COLLECTION_NAME, \
+    GENERAL_DOCS_COLLECTION_NAME, CHROMA_BATCH_SIZE, CHROMA_FLUSH_INTERVAL
 from utils.enums import SummaryType
+from utils.lexical_index import get_lexical_index
 
-chroma_commits = Chroma(
-    collection_name=COMMITS_COLLECTION_NAME,
-    embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL),
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
+chroma_commits = get_collection(COMMITS_COLLECTION_NAME)
+
+chroma_general_docs = get_collection(GENERAL_DOCS_COLLECTION_NAME)
+
+
+class ChromaBatchWriter:
+    """
+    Buffers documents and adds them to a Chroma collection in batches,
+    so that a single embedding call and a single insert are done for each batch.
+    A batch is flushed when it reaches `batch_size` documents or when `flush_interval` seconds passed since the last flush.
+    If `lexical_collection` is given, the documents are also added to the lexical index under that name.
+    """
+
+    def __init__(self, store: Chroma, batch_size: int = CHROMA_BATCH_SIZE, flush_interval: float = CHROMA_FLUSH_INTERVAL,
+                 lexical_collection: str | None = None):
+        self.store = store
+        self.lexical_collection = lexical_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.documents: list[Document] = []
+        self.ids: list[str] = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, document: Document, doc_id: str) -> None:
+        with self.lock:
+            self.documents.append(document)
+            self.ids.append(doc_id)
+            if len(self.documents) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.documents:
+            self.store.add_documents(self.documents, ids=self.ids)
+            if self.lexical_collection is not None:
+                get_lexical_index().add(self.lexical_collection, self.documents, self.ids)
+        self.documents, self.ids = [], []
+        self.last_flush = time.monotonic()
+
+
+commits_writer = ChromaBatchWriter(chroma_commits, lexical_collection=COMMITS_COLLECTION_NAME)
 
-chroma_general_docs = Chroma(
-    collection_name=GENERAL_DOCS_COLLECTION_NAME,
-    embedding_function=OllamaEmbeddings(model=EMBEDDING_MODEL),
-    collection_metadata=CHROMA_METADATA,
-    persist_directory=CHROMA_PERSIST_DIR,
-)
 
 def save_commit_to_chromadb(commit, idx, summary_type: SummaryType):
+    """
+    Buffer a commit summary to be saved in the ChromaDB collection.
+    The pending documents are written when a batch is full, or by `flush_commits_to_chromadb`.
+    """
     # Use commit message and summary as the document text
     doc_text: str
     if summary_type == SummaryType.GENERAL:
@@ -40,20 +80,76 @@ def save_commit_to_chromadb(commit, idx, summary_type: SummaryType):
         "type": summary_type.value,
     }
 
-    chroma_commits.add_documents([Document(page_content=doc_text, metadata=metadata)], ids=[str(idx)])
+    # the general and technical summaries of a commit must have different ids to be in the same batch
+    commits_writer.add(Document(page_content=doc_text, metadata=metadata), f"{idx}_{summary_type.value}")
 
 
-def retrieve_top_commits_by_summary_type(query_text, summary_type:SummaryType, n_results=3, threshold=0.7) -> list[tuple[Document, float]]:
-    results = chroma_commits.similarity_search_with_relevance_scores(
-        query=query_text,
+def flush_commits_to_chromadb() -> None:
+    """
+    Write all the buffered commit summaries to the ChromaDB collection.
+    """
+    commits_writer.flush()
+
+
+def build_retrieval_query(commit, max_files=10, max_lines_per_file=8, max_chars=2000) -> str:
+    """
+    Builds a short query describing a commit, used to retrieve similar commits.
+    It contains the commit message, the changed files and the first changed lines of each diff,
+    instead of the whole summarization prompt (whose fixed few-shot examples would dominate the similarity).
+
+    Args:
+        commit (dict): The commit data.
+        max_files (int): Maximum number of files and diffs included.
+        max_lines_per_file (int): Maximum number of changed lines included for each file.
+        max_chars (int): Maximum length of the query.
+
+    Returns:
+        str: The retrieval query.
+    """
+    files = commit.get('files', [])[:max_files]
+    hunks = []
+    for file_name, diff in list(commit.get('diffs', {}).items())[:max_files]:
+        # skip lines without content (e.g. only '+' or '-')
+        lines = [line.strip() for line in diff.splitlines() if len(line.strip()) > 1][:max_lines_per_file]
+        if lines:
+            hunks.append(f"{file_name}:\n" + "\n".join(lines))
+
+    query = (
+        f"{commit.get('message', '')}\n"
+        f"Files: {', '.join(files)}\n"
+        + "\n".join(hunks)
+    )
+    return query[:max_chars]
+
+
+def embed_retrieval_query(commit) -> list[float]:
+    """
+    Embeds the retrieval query of a commit, so it can be reused for both summary types.
+    """
+    return chroma_commits.embeddings.embed_query(build_retrieval_query(commit))
+
+
+def retrieve_top_commits_by_summary_type(query_embedding, summary_type:SummaryType, n_results=3, threshold=0.7,
+                                         max_index=None) -> list[tuple[Document, float]]:
+    """
+    Retrieves the summaries of the commits most similar to the query.
+    With `max_index`, only the commits with an index up to it are retrieved, so that the result doesn't depend on
+    which of the commits processed concurrently were saved first.
+    The summaries still buffered (see `flush_commits_to_chromadb`) are not retrieved.
+    """
+    summary_filter = {"type": summary_type.value}
+    if max_index is not None:
+        summary_filter = {"$and": [summary_filter, {"index": {"$lte": max_index}}]}
+
+    results = chroma_commits.similarity_search_by_vector_with_relevance_scores(
+        embedding=query_embedding,
         k=n_results,
-        score_threshold=threshold,
-        filter={
-            "type": summary_type.value
-        }
+        filter=summary_filter
     )
 
-    return results
+    # the search by vector returns cosine distances: convert them to relevance scores and apply the threshold
+    scored_results = [(doc, 1.0 - distance) for doc, distance in results]
+    return [(doc, score) for doc, score in scored_results if score >= threshold]
 
 
 def format_retrieved_docs(retrieved_docs):
@@ -68,22 +164,29 @@ def delete_all_documents():
     """
     chroma_commits.reset_collection()
     chroma_general_docs.reset_collection()
+    get_lexical_index().clear(COMMITS_COLLECTION_NAME)
 
 
 def save_general_document_to_chromadb(docs: dict) -> None:
     """
-    Save a general document to the ChromaDB collection.
+    Save the chunks of the general documents to the ChromaDB collection, in batches.
+    The id of a chunk is `filename:chunk_index`.
     """
     documents = [
         Document(
             page_content=doc['content'],
             metadata={
                 "filename": doc['filename'],
-                "insert_date": doc['insert_date']
+                "insert_date": doc['insert_date'],
+                "title": doc.get('title', doc['filename']),
+                "section": doc.get('section', ''),
+                "chunk_index": doc.get('chunk_index', 0)
             }
         ) for doc in docs.values()
     ]
-    chroma_general_docs.add_documents(documents)
+    ids = [f"{doc.metadata['filename']}:{doc.metadata['chunk_index']}" for doc in documents]
+    for i in range(0, len(documents), 500):
+        chroma_general_docs.add_documents(documents[i:i + 500], ids=ids[i:i + 500])
 
 
 def retrieve_general_docs(query_text: str, n_results=5) -> list[Document]:
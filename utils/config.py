@@ -5,6 +5,8 @@ ONLINE_MODEL_NAME = "qwen3:8b"#"deepseek-r1:8b" #"llama3.1:8b-instruct-q8_0"
 OFFLINE_MODEL_NAME = "llama3.1:8b-instruct-q8_0"  # For offline use
 EMBEDDING_MODEL = "nomic-embed-text"
 SEED = 42
+EMBEDDING_CACHE_PATH = "db_sqllite/embedding_cache.db"
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000    # least recently used embeddings are evicted beyond this size
 NUM_CTX = 32768
 
 # ChromaDB
@@ -13,20 +15,62 @@ CHROMA_PERSIST_DIR = "./chromadb_v1"
 COMMITS_COLLECTION_NAME = "commits"
 GENERAL_DOCS_COLLECTION_NAME = "general_docs"
 SEMANTIC_CODE_COLLECTION = "mujs_code_main"
+CODE_CHUNK_MAX_LINES = 120     # longer definitions are split in windows
+CODE_CHUNK_OVERLAP = 5         # lines of the previous chunk repeated at the start of a chunk
+CHROMA_BATCH_SIZE = 32         # documents embedded and inserted together
+CHROMA_FLUSH_INTERVAL = 30     # seconds after which a partial batch is written
+LEXICAL_INDEX_PATH = "db_sqllite/lexical_index.db"    # BM25 index of the commits and code collections
+RRF_K = 60                     # rank constant of the reciprocal rank fusion
 
 # SQLite
 SQL_PERSIST_DIR = "db_sqllite/sqlite.db"
+SQLITE_CACHE_SIZE_KB = 65536    # page cache of each connection
+LOG_BATCH_SIZE = 200            # log records inserted together
+LOG_FLUSH_INTERVAL = 2          # seconds after which the pending log records are written
 
 # MuJS
 MUJS_REMOTE_URL = 'https://github.com/ccxvii/mujs.git'
 MUJS_LOCAL_PATH = './mujs'
 MUJS_ABSOLUTE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'mujs'))
 MUJS_DOCS_LOCAL_PATH = './mujs/docs'
+DOCS_CHUNK_MAX_CHARS = 1500    # documentation sections longer than this are split
 MUJS_BRANCH = "master"
+GIT_EXTRACTION_WORKERS = 4    # git log processes run in parallel to extract the commits (1 for a single one)
 
 # Ollama
 OLLAMA_CLIENT_HOST = 'http://localhost:11434'
+OLLAMA_NUM_PARALLEL = 4    # keep in sync with the OLLAMA_NUM_PARALLEL of the server
+
+# Online answer cache
+ANSWER_CACHE_ENABLED = False        # reuse the answers of repeated questions
+ANSWER_CACHE_TTL = 3600             # seconds an answer is valid
+ANSWER_CACHE_MAX_ENTRIES = 256      # least recently used answers are evicted beyond this size
+ANSWER_CACHE_SIMILARITY = 0.95      # cosine similarity above which two questions are the same
+ANSWER_CACHE_VERSION_INTERVAL = 10  # seconds between two checks of the commit data
+
+# SQL tool of the online agent
+NL2SQL_CACHE_PATH = "db_sqllite/nl2sql_cache.db"
+NL2SQL_CACHE_MAX_ENTRIES = 1000     # least recently used SQL translations are evicted beyond this size
+SQL_TOOL_MAX_ROWS = 50              # rows returned by the SQL tool in one page
+SQL_TOOL_MAX_CHARS = 8000           # characters of the rows returned in one page
+SQL_TOOL_MAX_CELL_CHARS = 400       # longer values (e.g. diffs) are truncated
+
+# Context budget of the online agent tools (estimated tokens)
+CONTEXT_TOOL_MAX_TOKENS = 4000      # tokens returned by a tool call
+CONTEXT_DOC_MAX_TOKENS = 1200       # longer documents are cut to their most relevant lines
+CONTEXT_MIN_DOC_TOKENS = 150        # documents are omitted when less budget is left
+CONTEXT_DEDUP_OVERLAP = 0.8         # share of lines already returned above which a document is dropped
 
 # Offline pipeline parameters
 OFFLINE_PIPELINE_TEST_NAME = "final_exp_8"
 NEW_EXAMPLES = True
+INCREMENTAL_MODE = False    # process only the commits after the last one saved in SQLite
+INCREMENTAL_GIT_PULL = True    # fast-forward the local repository (network) before an incremental run
+OFFLINE_COMMITS_IN_FLIGHT = 2    # commits processed concurrently by the offline pipeline
+
+# Technical summary QA loop budget
+TECH_SUMMARY_MARK_THRESHOLD = 8     # QA mark that accepts a draft
+TECH_SUMMARY_MAX_ITERATIONS = 10
+TECH_SUMMARY_MAX_TOKENS = 8000      # generated tokens (drafts + QA), None for no limit
+TECH_SUMMARY_MAX_SECONDS = 300      # wall-clock seconds, None for no limit
+TECH_SUMMARY_PATIENCE = 3           # iterations without a better mark before stopping
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+from utils.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_MODEL
+from utils.sqlite_connection import get_connection
+
+# cache hits whose access time is written together (the eviction writes the pending ones first)
+_TOUCH_BATCH_SIZE = 1000
+
+
+class CachedOllamaEmbeddings(Embeddings):
+    """
+    OllamaEmbeddings with a persistent SQLite cache keyed on (model name, sha256 of the text),
+    so unchanged texts (summaries, code files, documents, queries) are never embedded twice.
+    When the cache exceeds `max_entries`, the least recently used embeddings are evicted.
+    The access times of the hits are kept in memory and written in batches, so reads don't write to the database.
+    """
+
+    def __init__(self, model: str, db_path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.model = model
+        self.embeddings = OllamaEmbeddings(model=model)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.touched: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = get_connection(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT,
+                text_hash TEXT,
+                vector BLOB,
+                last_access REAL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        conn.commit()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        cached = self._get(hashes)
+
+        # embed only the texts not in cache (once, even if repeated in the input)
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), vectors))
+            self._put(new_vectors)
+            cached.update(new_vectors)
+
+        with self.lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        """Returns the number of texts found in the cache and embedded by Ollama since the start of the process."""
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+    def _get(self, hashes: list[str]) -> dict[str, list[float]]:
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        unique_hashes = list(set(hashes))
+        found = {}
+        # chunked to stay below the SQLite limit of bound parameters
+        for i in range(0, len(unique_hashes), 500):
+            chunk = unique_hashes[i:i + 500]
+            cursor.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                [self.model, *chunk]
+            )
+            for text_hash, vector in cursor.fetchall():
+                found[text_hash] = array("f", vector).tolist()
+
+        if found:
+            now = time.time()
+            with self.lock:
+                self.touched.update(dict.fromkeys(found, now))
+                write = len(self.touched) >= _TOUCH_BATCH_SIZE
+            if write:
+                self._write_touched(cursor)
+                conn.commit()
+
+        return found
+
+    def _write_touched(self, cursor) -> None:
+        """Writes the pending access times of the cache hits."""
+        with self.lock:
+            touched, self.touched = self.touched, {}
+        cursor.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+            [(last_access, self.model, h) for h, last_access in touched.items()]
+        )
+
+    def _put(self, vectors: dict[str, list[float]]) -> None:
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        now = time.time()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+            [(self.model, h, array("f", vector).tobytes(), now) for h, vector in vectors.items()]
+        )
+
+        # size-based eviction of the least recently used embeddings, with up-to-date access times
+        self._write_touched(cursor)
+        cursor.execute("SELECT COUNT(*) FROM embeddings")
+        excess = cursor.fetchone()[0] - self.max_entries
+        if excess > 0:
+            cursor.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+
+        conn.commit()
+
+
+_embeddings: dict[str, CachedOllamaEmbeddings] = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings(model: str = EMBEDDING_MODEL) -> CachedOllamaEmbeddings:
+    """
+    Returns the process-wide embedding function of a model, creating it on first use.
+    """
+    with _embeddings_lock:
+        if model not in _embeddings:
+            _embeddings[model] = CachedOllamaEmbeddings(model)
+        return _embeddings[model]
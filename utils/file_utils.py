@@ -1,3 +1,4 @@
+import json
 import os
 import pickle
 
@@ -7,6 +8,11 @@ def full_path(data_filepath, name_file):
   return path
 
 
+def checkpoint_path(data_filepath, name_file):
+  path = os.path.join(data_filepath, f"commits_{name_file}.jsonl")
+  return path
+
+
 def save_commits(commits, file_path):
     """
     Save commits to a file using pickle, creating directories if they do not exist.
@@ -47,4 +53,58 @@ def save_variable(variable, file_path):
     # Now save the variable to the file
     with open(file_path, "wb") as file:
         pickle.dump(variable, file)
-    print(f"Variable saved to {file_path}")
\ No newline at end of file
+    print(f"Variable saved to {file_path}")
+
+
+# Fields produced by the offline pipeline for each commit, the only ones saved in the checkpoints
+CHECKPOINT_FIELDS = ('llama_category', 'llama_summary', 'llama_tech_summary', 'llama_tech_summary_stats')
+
+
+def append_commit_checkpoint(idx, commit, file_path):
+    """
+    Append the results of a processed commit to a JSONL checkpoint file, creating directories if they do not exist.
+    Only the fields produced by the pipeline are written, so the cost is proportional to the processed commit.
+
+    :param idx: The index of the commit.
+    :param commit: The processed commit.
+    :param file_path: The path of the checkpoint file.
+    """
+    directory = os.path.dirname(file_path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    record = {'index': idx, **{field: commit.get(field, '') for field in CHECKPOINT_FIELDS}}
+    line = json.dumps(record) + "\n"
+    # the last record of a crashed run can be truncated: start on a new line, so that only that record is lost
+    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        with open(file_path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                line = "\n" + line
+    with open(file_path, "a", encoding="utf-8") as file:
+        file.write(line)
+
+
+def load_commits_checkpoint(commits, file_path):
+    """
+    Rebuild the processed commits by applying the records of a JSONL checkpoint file to the raw commits.
+
+    :param commits: The raw commits, updated in place.
+    :param file_path: The path of the checkpoint file.
+    :return: The commits, with the results of the already processed ones.
+    """
+    if not os.path.exists(file_path):
+        return commits
+
+    with open(file_path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last record can be truncated if the previous run crashed while writing it
+                continue
+            if record['index'] in commits:
+                # the records written before the stats were checkpointed don't have them
+                commits[record['index']].update({field: record[field] for field in CHECKPOINT_FIELDS if field in record})
+
+    return commits
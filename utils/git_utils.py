@@ -1,15 +1,28 @@
+import concurrent.futures
 import datetime
 import glob
 import os
+import re
+import subprocess
+import tempfile
 
 from git import Repo
 
-from utils.config import MUJS_DOCS_LOCAL_PATH, MUJS_BRANCH
+from utils.config import MUJS_DOCS_LOCAL_PATH, MUJS_BRANCH, GIT_EXTRACTION_WORKERS
+from utils.html_utils import html_to_sections, chunk_text
 
 
 def extract_git_commits(repo_path, branch=MUJS_BRANCH):
     """
     Extracts commit information from a Git repository.
+    The offline pipeline uses `stream_git_commits`, which doesn't keep all the commits in memory.
+
+    Args:
+        repo_path (str): Path of the local Git repository.
+        branch (str): Branch to walk.
+
+    Returns:
+        dict: Commits indexed from the oldest (0) to the newest.
     """
     repo = Repo(repo_path)
     commits = list(repo.iter_commits(branch))
@@ -18,28 +31,262 @@ def extract_git_commits(repo_path, branch=MUJS_BRANCH):
     commits.reverse()
 
     for i, commit in enumerate(commits):
-        commits_dict[i] = {
-            'hash': commit.hexsha,
-            'author': f"{commit.author.name} <{commit.author.email}>",
-            'date': commit.authored_datetime,
-            'message': commit.message.strip(),
-            'files': list(commit.stats.files.keys()),
-            'diffs': {},
-            'llama_summary': '',
-            'llama_category': '',
-            'llama_tech_summary': ''
-        }
-
-        diffs = commit.diff(commit.parents[0] if commit.parents else None, create_patch=True, R=True)
-
-        for diff in diffs:
-            file_diff = diff.diff.decode('utf-8')
-            file_name = f"{diff.a_path} -> {diff.b_path}" if diff.a_path != diff.b_path else diff.a_path
-            commits_dict[i]['diffs'][file_name] = filter_diff_lines(file_diff)
+        commits_dict[i] = _commit_to_dict(commit)
 
     print(f"Extracted {len(commits_dict)} commits")
     return commits_dict
 
+
+def _commit_to_dict(commit):
+    """
+    Converts a GitPython commit into the commit dictionary used by the pipelines.
+    """
+    commit_data = {
+        'hash': commit.hexsha,
+        'author': f"{commit.author.name} <{commit.author.email}>",
+        'date': commit.authored_datetime,
+        'message': commit.message.strip(),
+        'files': list(commit.stats.files.keys()),
+        'diffs': {},
+        'llama_summary': '',
+        'llama_category': '',
+        'llama_tech_summary': ''
+    }
+
+    diffs = commit.diff(commit.parents[0] if commit.parents else None, create_patch=True, R=True)
+
+    for diff in diffs:
+        file_diff = diff.diff.decode('utf-8')
+        file_name = f"{diff.a_path} -> {diff.b_path}" if diff.a_path != diff.b_path else diff.a_path
+        commit_data['diffs'][file_name] = filter_diff_lines(file_diff)
+
+    return commit_data
+
+# Separators used in the `git log` format: they can't appear in author names or commit messages
+_GIT_LOG_COMMIT_START = "\x1e"
+_GIT_LOG_FIELD_SEP = "\x1f"
+_GIT_LOG_MESSAGE_END = "\x1d"
+_GIT_LOG_FORMAT = f"{_GIT_LOG_COMMIT_START}%H{_GIT_LOG_FIELD_SEP}%an{_GIT_LOG_FIELD_SEP}%ae{_GIT_LOG_FIELD_SEP}%aI" \
+                  f"{_GIT_LOG_FIELD_SEP}%B{_GIT_LOG_MESSAGE_END}"
+# A path quoted by git: "a/\303\274.c" (only the paths with quotes, backslashes or control characters
+# are quoted, since core.quotePath is disabled)
+_QUOTED_PATH_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+# A renamed path of --numstat: `old => new`, or `dir/{old => new}/file` for the common parts
+_NUMSTAT_RENAME_RE = re.compile(r"(.*)\{(.*) => (.*)\}(.*)")
+
+
+def stream_git_commits(repo_path, branch=MUJS_BRANCH, workers=GIT_EXTRACTION_WORKERS):
+    """
+    Extracts commit information from a Git repository as a stream.
+    With a single worker, one `git log --reverse -p --numstat` process is spawned and its output is parsed line by
+    line. With more workers, the commits are split in `workers` consecutive shards, whose `git log` processes run
+    in parallel writing to temporary files, which are parsed in order.
+    Either way only the commit being parsed is kept in memory, and the commits are the same.
+
+    Args:
+        repo_path (str): Path of the local Git repository.
+        branch (str): Branch (or revision range) to walk.
+        workers (int): Number of `git log` processes run in parallel.
+
+    Yields:
+        dict: The commits, from the oldest to the newest, with the same fields produced by `extract_git_commits`.
+
+    Raises:
+        RuntimeError: If `git log` fails (e.g. unknown branch or revision range).
+    """
+    if workers > 1:
+        yield from _stream_git_commits_sharded(repo_path, branch, workers)
+        return
+
+    cmd = _git_log_command(repo_path) + ["--reverse", branch, "--"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8",
+                               errors="replace")
+
+    try:
+        yield from _parse_git_log(process.stdout)
+        # the error output is small, so it can be read once the standard output is consumed
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"git log {branch} failed with exit code {process.returncode}: {stderr.strip()}")
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+
+
+def _git_log_command(repo_path):
+    """
+    Returns the `git log` command of `stream_git_commits`, without the revisions to walk.
+    """
+    return [
+        "git", "-C", repo_path, "-c", "core.quotePath=false", "log", "-p", "--numstat", "-M",
+        "--diff-merges=first-parent", "--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/",
+        f"--format={_GIT_LOG_FORMAT}",
+    ]
+
+
+def _stream_git_commits_sharded(repo_path, branch, workers):
+    """
+    Parallel version of `stream_git_commits`: the commits listed by `git rev-list --reverse` (the order of
+    `git log --reverse`) are split in consecutive shards, each one shown by a `git log --no-walk` process.
+    """
+    rev_list = subprocess.run(["git", "-C", repo_path, "rev-list", "--reverse", branch, "--"],
+                              capture_output=True, text=True)
+    if rev_list.returncode != 0:
+        raise RuntimeError(f"git rev-list {branch} failed with exit code {rev_list.returncode}: "
+                           f"{rev_list.stderr.strip()}")
+    revisions = rev_list.stdout.split()
+    if not revisions:
+        return
+
+    shard_size = -(-len(revisions) // workers)
+    shards = [revisions[i:i + shard_size] for i in range(0, len(revisions), shard_size)]
+    cmd = _git_log_command(repo_path) + ["--no-walk=unsorted", "--stdin"]
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(shards))
+    futures = [executor.submit(_git_log_to_file, cmd, shard) for shard in shards]
+    try:
+        for future in futures:
+            with future.result() as output:
+                yield from _parse_git_log(output)
+    finally:
+        # the temporary files of the shards not parsed (after an error or an early stop) are deleted
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+
+def _git_log_to_file(cmd, revisions):
+    """
+    Runs `git log` on the given commits (in their order), writing its output to a temporary file.
+    """
+    output = tempfile.TemporaryFile(mode="w+", encoding="utf-8", errors="replace")
+    process = subprocess.run(cmd, input="\n".join(revisions) + "\n", stdout=output, stderr=subprocess.PIPE,
+                             text=True, encoding="utf-8", errors="replace")
+    if process.returncode != 0:
+        output.close()
+        raise RuntimeError(f"git log failed with exit code {process.returncode}: {process.stderr.strip()}")
+    output.seek(0)
+    return output
+
+
+def _parse_git_log(lines):
+    """
+    Parses the output of the `git log` of `stream_git_commits`, yielding one commit at a time.
+    """
+    commit = None
+    header_lines = []
+    in_header = False
+    file_name = None
+    file_lines = []
+
+    def _close_file():
+        if commit is not None and file_name is not None:
+            commit['diffs'][file_name] = filter_diff_lines("\n".join(file_lines))
+
+    for line in lines:
+        line = line.rstrip("\n")
+
+        if line.startswith(_GIT_LOG_COMMIT_START):
+            _close_file()
+            if commit is not None:
+                yield commit
+            commit, file_name, file_lines = None, None, []
+            header_lines = [line[len(_GIT_LOG_COMMIT_START):]]
+            in_header = _GIT_LOG_MESSAGE_END not in line
+            if not in_header:
+                commit = _parse_git_log_header(header_lines)
+            continue
+
+        if in_header:
+            header_lines.append(line)
+            if _GIT_LOG_MESSAGE_END in line:
+                in_header = False
+                commit = _parse_git_log_header(header_lines)
+            continue
+
+        if commit is None:
+            continue
+
+        if line.startswith("diff --git "):
+            _close_file()
+            file_name = _diff_file_name(line)
+            file_lines = []
+        elif file_name is not None:
+            file_lines.append(line)
+        elif line.count("\t") >= 2:
+            # --numstat line: "<added>\t<removed>\t<path>"
+            commit['files'].extend(_numstat_paths(line.split("\t", 2)[2]))
+
+    _close_file()
+    if commit is not None:
+        yield commit
+
+
+def _parse_git_log_header(header_lines):
+    """
+    Builds the commit dictionary from the formatted header of `stream_git_commits`.
+    """
+    header = "\n".join(header_lines).split(_GIT_LOG_MESSAGE_END)[0]
+    commit_hash, name, email, date, message = header.split(_GIT_LOG_FIELD_SEP, 4)
+    return {
+        'hash': commit_hash,
+        'author': f"{name} <{email}>",
+        'date': datetime.datetime.fromisoformat(date),
+        'message': message.strip(),
+        'files': [],
+        'diffs': {},
+        'llama_summary': '',
+        'llama_category': '',
+        'llama_tech_summary': ''
+    }
+
+
+def _unquote_path(path):
+    """
+    Decodes a path quoted by git, with C escapes and octal-escaped UTF-8 bytes.
+    """
+    if len(path) < 2 or not (path.startswith('"') and path.endswith('"')):
+        return path
+    return path[1:-1].encode("utf-8").decode("unicode_escape").encode("latin-1").decode("utf-8", errors="replace")
+
+
+def _diff_file_name(diff_header):
+    """
+    Extracts the file name from a `diff --git a/<old> b/<new>` line, using `old -> new` for renames.
+    """
+    paths = diff_header[len("diff --git "):]
+    if paths.startswith('"'):
+        match = _QUOTED_PATH_RE.match(paths)
+        a_path, b_path = match.group(0), paths[match.end() + 1:]
+    elif paths.endswith('"'):
+        a_path, _, b_path = paths.rpartition(' "b/')
+        b_path = '"b/' + b_path
+    else:
+        a_path, _, b_path = paths.partition(" b/")
+        b_path = "b/" + b_path
+    a_path, b_path = _unquote_path(a_path)[2:], _unquote_path(b_path)[2:]
+    return f"{a_path} -> {b_path}" if a_path != b_path else a_path
+
+
+def _numstat_paths(path):
+    """
+    Returns the changed files of a --numstat path. A renamed file is listed with its old and its new path,
+    as `commit.stats` of GitPython (which doesn't detect renames) does.
+    """
+    match = _NUMSTAT_RENAME_RE.fullmatch(path)
+    if match:
+        prefix, old, new, suffix = match.groups()
+        # `dir/{ => sub}/file`: an empty side leaves a double slash
+        return [_unquote_path(f"{prefix}{old}{suffix}".replace("//", "/")),
+                _unquote_path(f"{prefix}{new}{suffix}".replace("//", "/"))]
+    if " => " in path:
+        old, new = path.split(" => ", 1)
+        return [_unquote_path(old), _unquote_path(new)]
+    return [_unquote_path(path)]
+
+
 def filter_diff_lines(diff_text):
     """
     Filtra le righe di un diff Git, mantenendo solo quelle che iniziano con '+' o '-',
@@ -62,11 +309,11 @@ def filter_diff_lines(diff_text):
 def extract_mujs_docs() -> list[dict]:
     """
     Extracts documentation from MuJS HTML files.
-    Reads all HTML files in the mujs/docs directory and extracts the text content.
-    and extracts the text content.
+    Reads all HTML files in the mujs/docs directory, strips their markup and splits them by headings,
+    the long sections in chunks of at most DOCS_CHUNK_MAX_CHARS characters.
 
     Returns:
-        list: A list of dictionaries containing the filename and content of each document.
+        list: A list of dictionaries with the filename, title, section, chunk index and text content of each chunk.
     """
     docs = []
     pattern = os.path.join(os.path.dirname(os.path.dirname(__file__)), MUJS_DOCS_LOCAL_PATH, '*.html')
@@ -76,16 +323,29 @@ def extract_mujs_docs() -> list[dict]:
     if not files:
         print('No HTML files found. Check MUJS_DOCS_LOCAL_PATH:', MUJS_DOCS_LOCAL_PATH)
 
+    insert_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     for file in files:
         with open(file, encoding='utf-8') as f:
             html = f.read()
-            docs.append(
-                {
-                    'filename': os.path.basename(file),
-                    'insert_date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'content': html
-                }
-            )
+
+        filename = os.path.basename(file)
+        title, sections = html_to_sections(html)
+        title = title or filename
+        chunk_index = 0
+        for section, text in sections:
+            for chunk in chunk_text(text):
+                docs.append(
+                    {
+                        'filename': filename,
+                        'insert_date': insert_date,
+                        'title': title,
+                        'section': section,
+                        'chunk_index': chunk_index,
+                        # the title and the section are embedded with the text, to give context to the chunk
+                        'content': f"DOCUMENT: {title}\nSECTION: {section or '-'}\n---\n{chunk}"
+                    }
+                )
+                chunk_index += 1
     return docs
 
 
@@ -103,4 +363,8 @@ def format_code(doc):
     content = doc.page_content.strip()
     snippet = content
 
+    # chunks of the code index also report their line range
+    if "start_line" in doc.metadata:
+        path += f" (lines {doc.metadata['start_line']}-{doc.metadata['end_line']})"
+
     return f"FILE: {path}\n---\n{snippet}"
\ No newline at end of file
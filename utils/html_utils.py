@@ -0,0 +1,157 @@
+import re
+from html.parser import HTMLParser
+
+from utils.config import DOCS_CHUNK_MAX_CHARS
+
+_HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# elements whose content starts on a new line
+_BLOCKS = {"p", "div", "br", "li", "ul", "ol", "dl", "dt", "dd", "tr", "table", "pre", "blockquote", "hr", "section"}
+# elements without useful text
+_SKIPPED = {"script", "style", "head", "nav"}
+
+
+class _SectionExtractor(HTMLParser):
+    """
+    Converts an HTML page to plain text split by headings.
+    The text of <pre> blocks keeps its whitespace, the rest is collapsed to single spaces.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.sections: list[tuple[list[str], list[str]]] = [([], [])]    # (heading path, text lines)
+        self.headings: list[tuple[int, str]] = []
+        self.heading_level = None
+        self.heading_text = []
+        self.in_title = False
+        self.skip_depth = 0
+        self.pre_depth = 0
+        self.line = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED:
+            self.skip_depth += 1
+        elif tag == "title":
+            self.in_title = True
+        elif tag in _HEADINGS:
+            self._end_line()
+            self.heading_level = int(tag[1])
+            self.heading_text = []
+        elif tag in _BLOCKS:
+            self._end_line()
+            if tag == "pre":
+                self.pre_depth += 1
+        elif tag == "td" and self.line:
+            self.line.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == "title":
+            self.in_title = False
+        elif tag in _HEADINGS and self.heading_level is not None:
+            heading = re.sub(r"\s+", " ", "".join(self.heading_text)).strip()
+            # a heading closes the sections of the same or lower level
+            self.headings = [(level, text) for level, text in self.headings if level < self.heading_level]
+            if heading:
+                self.headings.append((self.heading_level, heading))
+            self.sections.append(([text for _, text in self.headings], []))
+            self.heading_level = None
+        elif tag in _BLOCKS:
+            self._end_line()
+            if tag == "pre":
+                self.pre_depth = max(0, self.pre_depth - 1)
+                self.sections[-1][1].append("")
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif self.skip_depth:
+            return
+        elif self.heading_level is not None:
+            self.heading_text.append(data)
+        elif self.pre_depth:
+            # preformatted text (code examples): keep the lines
+            lines = data.split("\n")
+            for line in lines[:-1]:
+                self.line.append(line)
+                self._end_line(keep_empty=True)
+            self.line.append(lines[-1])
+        else:
+            self.line.append(re.sub(r"\s+", " ", data))
+
+    def _end_line(self, keep_empty=False):
+        text = "".join(self.line)
+        text = text.rstrip() if self.pre_depth else text.strip()
+        if text or keep_empty:
+            self.sections[-1][1].append(text)
+        self.line = []
+
+    def close(self):
+        super().close()
+        self._end_line()
+
+
+def html_to_sections(html: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Strips the markup of an HTML page and splits its text by headings.
+
+    Args:
+        html (str): The HTML page.
+
+    Returns:
+        tuple: The title of the page and the (section, text) pairs, where the section is the path of the headings
+            (e.g. `Reference > Strings`) and the text has no markup.
+    """
+    parser = _SectionExtractor()
+    parser.feed(html)
+    parser.close()
+
+    sections = []
+    for headings, lines in parser.sections:
+        # collapse the runs of blank lines
+        text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+        if text:
+            sections.append((" > ".join(headings), text))
+    return parser.title.strip(), sections
+
+
+def chunk_text(text: str, max_chars: int = DOCS_CHUNK_MAX_CHARS) -> list[str]:
+    """
+    Splits a text in chunks of at most `max_chars` characters, on paragraph boundaries (blank lines) when possible,
+    then on line boundaries.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        pieces = [paragraph] if len(paragraph) <= max_chars else _split_long(paragraph, max_chars)
+        for piece in pieces:
+            if current and len(current) + 2 + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_long(paragraph: str, max_chars: int) -> list[str]:
+    pieces = []
+    current = ""
+    for line in paragraph.split("\n"):
+        # a single line longer than the limit is cut, on a space when possible
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip()
+        if current and len(current) + 1 + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
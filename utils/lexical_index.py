@@ -0,0 +1,230 @@
+import os
+import re
+import threading
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from utils.config import LEXICAL_INDEX_PATH, RRF_K
+from utils.sqlite_connection import get_connection
+
+# Metadata indexed together with the content of a document (identifiers the embeddings handle poorly)
+_LEXICAL_METADATA = ("commit_hash", "author", "message", "file_path", "function_name")
+_TOKEN_RE = re.compile(r"\w+")
+_HASH_RE = re.compile(r"(?=[0-9a-f]*\d)[0-9a-f]{7,39}")
+# stems of the file names of a query (jsarray.c → jsarray), which the tokenizer splits on the dot
+_FILE_STEM_RE = re.compile(r"\b([\w-]+)\.(?:c|h|md|html|txt|js|py)\b")
+# common words, which would match (almost) every document
+_STOPWORDS = frozenset("""
+    a about after all also an and any are as at be been before between but by can could did do does doing done each
+    for from get give has have how i if in into is it its me more most my no not of on only or other over please
+    show should so some such than that the their them then there these they this those through to under up very was
+    we were what when where which who whom why will with would you your
+""".split())
+
+
+def lexical_text(doc: Document) -> str:
+    """Returns the text of a document indexed by the lexical index: its content and its identifying metadata."""
+    metadata = doc.metadata or {}
+    return "\n".join([doc.page_content] + [str(metadata[key]) for key in _LEXICAL_METADATA if metadata.get(key)])
+
+
+def _is_identifier(token: str, file_stems: set[str]) -> bool:
+    """Whether a word of a query looks like a code identifier: js_pushstring, jsV_toString, utf8, a hash, a file name."""
+    return ("_" in token or any(c.isdigit() for c in token) or re.search(r"[a-z][A-Z]", token) is not None
+            or token.lower() in file_stems)
+
+
+def to_match_query(query: str, identifiers_only: bool = False) -> str:
+    """
+    Converts a free-text query to a FTS5 MATCH expression: any of its words except the stopwords,
+    as prefixes for commit hashes.
+    With `identifiers_only`, only the words that look like code identifiers are kept.
+    """
+    file_stems = {stem.lower() for stem in _FILE_STEM_RE.findall(query)}
+    terms = []
+    for token in _TOKEN_RE.findall(query):
+        lowered = token.lower()
+        if len(lowered) < 2 or lowered in _STOPWORDS:
+            continue
+        if identifiers_only and not _is_identifier(token, file_stems):
+            continue
+        term = f'"{lowered}"'
+        if _HASH_RE.fullmatch(lowered):
+            term += "*"    # abbreviated commit hash
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index of the documents of the Chroma collections, persisted in SQLite (FTS5).
+    It complements the vector search for identifiers (function names, commit hashes, file names),
+    and it is updated incrementally together with the collections.
+    """
+
+    def __init__(self, db_path: str = LEXICAL_INDEX_PATH):
+        self.db_path = db_path
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        conn = get_connection(self.db_path)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS lexical_docs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection TEXT,
+                doc_id TEXT,
+                content TEXT,
+                UNIQUE (collection, doc_id)
+            );
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS lexical_fts USING fts5(
+                content,
+                content='lexical_docs',
+                content_rowid='id',
+                tokenize="unicode61 tokenchars '_'"
+            );
+
+            CREATE TRIGGER IF NOT EXISTS lexical_fts_insert AFTER INSERT ON lexical_docs BEGIN
+                INSERT INTO lexical_fts (rowid, content) VALUES (new.id, new.content);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS lexical_fts_delete AFTER DELETE ON lexical_docs BEGIN
+                INSERT INTO lexical_fts (lexical_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+        """)
+        conn.commit()
+
+    def add(self, collection: str, documents: list[Document], ids: list[str]) -> None:
+        """Adds (or replaces) documents of a collection."""
+        conn = get_connection(self.db_path)
+        # the delete triggers remove the old versions from the full-text index
+        conn.executemany("DELETE FROM lexical_docs WHERE collection = ? AND doc_id = ?",
+                         [(collection, doc_id) for doc_id in ids])
+        conn.executemany("INSERT INTO lexical_docs (collection, doc_id, content) VALUES (?, ?, ?)",
+                         [(collection, doc_id, lexical_text(doc)) for doc, doc_id in zip(documents, ids)])
+        conn.commit()
+
+    def delete(self, collection: str, ids: list[str]) -> None:
+        """Removes documents of a collection."""
+        conn = get_connection(self.db_path)
+        conn.executemany("DELETE FROM lexical_docs WHERE collection = ? AND doc_id = ?",
+                         [(collection, doc_id) for doc_id in ids])
+        conn.commit()
+
+    def clear(self, collection: str) -> None:
+        """Removes all the documents of a collection."""
+        conn = get_connection(self.db_path)
+        conn.execute("DELETE FROM lexical_docs WHERE collection = ?", (collection,))
+        conn.commit()
+
+    def ids(self, collection: str) -> set[str]:
+        conn = get_connection(self.db_path)
+        return {row[0] for row in conn.execute("SELECT doc_id FROM lexical_docs WHERE collection = ?", (collection,))}
+
+    def search(self, collection: str, query: str, k: int, identifiers_only: bool = False) -> list[str]:
+        """
+        Returns the ids of the `k` documents of a collection that best match the query, by BM25 rank.
+        With `identifiers_only`, only the identifiers of the query are searched (see `to_match_query`).
+        """
+        match_query = to_match_query(query, identifiers_only)
+        if not match_query:
+            return []
+
+        conn = get_connection(self.db_path)
+        rows = conn.execute("""
+            SELECT lexical_docs.doc_id
+            FROM lexical_fts
+            JOIN lexical_docs ON lexical_docs.id = lexical_fts.rowid
+            WHERE lexical_fts MATCH ? AND lexical_docs.collection = ?
+            ORDER BY bm25(lexical_fts)
+            LIMIT ?
+        """, (match_query, collection, k)).fetchall()
+        return [row[0] for row in rows]
+
+    def sync(self, store: Chroma, collection: str) -> None:
+        """
+        Aligns the index with a Chroma collection, e.g. for collections filled before the creation of the index:
+        the missing documents are added and the ones no longer in the collection are removed.
+        """
+        store_ids = set(store.get(include=[])["ids"])
+        indexed_ids = self.ids(collection)
+
+        missing = list(store_ids - indexed_ids)
+        for i in range(0, len(missing), 500):
+            batch = store.get(ids=missing[i:i + 500], include=["documents", "metadatas"])
+            documents = [Document(page_content=content or "", metadata=metadata or {})
+                         for content, metadata in zip(batch["documents"], batch["metadatas"])]
+            self.add(collection, documents, batch["ids"])
+
+        stale = list(indexed_ids - store_ids)
+        if stale:
+            self.delete(collection, stale)
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Returns the process-wide lexical index, opening it on first use.
+    """
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex()
+        return _lexical_index
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """
+    Merges rankings of document ids: each document scores the sum of 1 / (k + rank) over the rankings it appears in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search(store: Chroma, collection: str, query: str, k: int = 4, score_threshold: float | None = None) \
+        -> list[Document]:
+    """
+    Retrieves the documents of a collection combining the vector search of Chroma and the BM25 search of the
+    lexical index with reciprocal rank fusion.
+    With a `score_threshold`, the lexical search is limited to the identifiers of the query (function names,
+    hashes, file names): a query without relevant vector results and without identifiers returns nothing.
+
+    Args:
+        store (Chroma): The collection.
+        collection (str): The name of the collection.
+        query (str): The query.
+        k (int): The number of documents returned.
+        score_threshold (float | None): Minimum relevance score of the vector results.
+
+    Returns:
+        list[Document]: The fused results, best first.
+    """
+    fetch_k = 2 * k
+    if score_threshold is None:
+        vector_docs = store.similarity_search(query, k=fetch_k)
+    else:
+        vector_docs = [doc for doc, _ in store.similarity_search_with_relevance_scores(
+            query, k=fetch_k, score_threshold=score_threshold)]
+    lexical_ids = get_lexical_index().search(collection, query, fetch_k, identifiers_only=score_threshold is not None)
+
+    docs = {doc.id: doc for doc in vector_docs if doc.id}
+    ranked_ids = reciprocal_rank_fusion([[doc.id for doc in vector_docs if doc.id], lexical_ids])[:k]
+
+    # fetch the documents found only by the lexical search
+    missing = [doc_id for doc_id in ranked_ids if doc_id not in docs]
+    if missing:
+        found = store.get(ids=missing, include=["documents", "metadatas"])
+        for doc_id, content, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+            docs[doc_id] = Document(id=doc_id, page_content=content or "", metadata=metadata or {})
+
+    return [docs[doc_id] for doc_id in ranked_ids if doc_id in docs]
@@ -1,3 +1,5 @@
+import re
+import threading
 
 
 def clean_text_paragraph(text):
@@ -9,4 +11,23 @@ def clean_text_paragraph(text):
     cleaned_lines = [line.strip() for line in lines if line.strip()]
     cleaned_text = "\n".join(cleaned_lines)
 
-    return cleaned_text
\ No newline at end of file
+    return cleaned_text
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases a question, collapses the whitespaces and removes the final punctuation."""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+class BoundedOllamaClient:
+    """
+    Wrapper of an Ollama client that limits the number of concurrent requests,
+    so that the pipeline doesn't send more requests than the server can run in parallel (`OLLAMA_NUM_PARALLEL`).
+    """
+
+    def __init__(self, client, max_parallel_requests):
+        self.client = client
+        self.semaphore = threading.BoundedSemaphore(max_parallel_requests)
+
+    def generate(self, *args, **kwargs):
+        with self.semaphore:
+            return self.client.generate(*args, **kwargs)
@@ -1,14 +1,21 @@
+import atexit
 import logging
-import sqlite3
+import logging.handlers
+import queue
+import threading
+import time
 from datetime import datetime
 
+from utils.config import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL
+from utils.sqlite_connection import get_connection
+
 class SQLiteHandler(logging.Handler):
     def __init__(self, db_path):
         super().__init__()
         self.db_path = db_path
 
     def emit(self, record):
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
 
         log_entry = self.format(record)
@@ -18,4 +25,65 @@ class SQLiteHandler(logging.Handler):
         """, (datetime.fromtimestamp(record.created).isoformat(), record.levelname, log_entry))
 
         conn.commit()
-        conn.close()
+
+
+class AsyncSQLiteHandler(logging.handlers.QueueHandler):
+    """
+    Logging handler that writes the records to SQLite on a background thread.
+    The calling thread only formats the record and puts it in a queue, so it never waits for disk I/O.
+    The background thread inserts the records in batches (a single `executemany` and commit),
+    flushing when `batch_size` records are queued, every `flush_interval` seconds, and on shutdown.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(queue.SimpleQueue())
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = threading.Thread(target=self._run, name="AsyncSQLiteHandler", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Flushes the pending records and stops the background thread."""
+        if self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join()
+        super().close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            records = []
+            deadline = time.monotonic() + self.flush_interval
+
+            # collect records until the batch is full, the interval expires or the handler is closed
+            while len(records) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is self._STOP:
+                    stopping = True
+                    break
+                records.append(record)
+
+            if records:
+                self._write(records)
+
+    def _write(self, records):
+        conn = get_connection(self.db_path)
+        try:
+            conn.executemany("""
+                INSERT INTO logs (created, level, message)
+                VALUES (?, ?, ?)
+            """, [
+                (datetime.fromtimestamp(record.created).isoformat(), record.levelname, record.getMessage())
+                for record in records
+            ])
+            conn.commit()
+        except Exception:
+            for record in records:
+                self.handleError(record)
@@ -1,46 +1,345 @@
 import os
+import re
 from pathlib import Path
 
-from langchain_chroma import Chroma
-from langchain_community.document_loaders.git import GitLoader
-from langchain_ollama import OllamaEmbeddings
+from git import Repo
+from langchain_core.documents import Document
 
-from utils.config import CHROMA_PERSIST_DIR, CHROMA_METADATA, MUJS_ABSOLUTE_PATH, MUJS_BRANCH, \
-    SEMANTIC_CODE_COLLECTION, EMBEDDING_MODEL
+from utils.chroma_registry import get_collection
+from utils.config import MUJS_ABSOLUTE_PATH, MUJS_BRANCH, \
+    SEMANTIC_CODE_COLLECTION, CODE_CHUNK_MAX_LINES, CODE_CHUNK_OVERLAP
+from utils.lexical_index import get_lexical_index
+from utils.sqlite_utils import save_symbols
 
-embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
+_C_EXTENSIONS = (".c", ".h")
+_FUNCTION_NAME_RE = re.compile(r"(\w+)\s*\(")
+_TYPE_NAME_RE = re.compile(r"\b(?:struct|union|enum)\s+(\w+)")
+_TYPEDEF_NAME_RE = re.compile(r"}\s*(\w+)\s*;")
 
 
-def build_mujs_code_index():
-    loader = GitLoader(
-        repo_path=MUJS_ABSOLUTE_PATH,
-        clone_url=None,
-        branch=MUJS_BRANCH,
-        file_filter=lambda fp: fp.endswith((".c", ".h", ".md")) or fp == "Makefile",
-    )
-    docs = loader.load()
-
-    for d in docs:
-        src = d.metadata.get("source") or d.metadata.get("file_path") or ""
-        full_name = os.path.basename(src)
-        stem = Path(full_name).stem.lower()
-        ext = Path(full_name).suffix.lower()
-        # update metadata
-        d.metadata.update({
-            "path": src,                # original path if available
-            "file_name": full_name,     # e.g., "opnames.h"
-            "stem": stem,               # e.g., "opnames"
-            "ext": ext,                 # e.g., ".h"
+def _is_indexed_file(path: str) -> bool:
+    return path.endswith(_C_EXTENSIONS + (".md",)) or os.path.basename(path) == "Makefile"
+
+
+def _strip_literals(line: str, in_comment: bool) -> tuple[str, bool]:
+    """
+    Removes comments, strings and character literals from a line of C code, so that their braces are not counted.
+    Returns the stripped line and whether the line ends inside a block comment.
+    """
+    out = []
+    i = 0
+    while i < len(line):
+        if in_comment:
+            end = line.find("*/", i)
+            if end == -1:
+                return "".join(out), True
+            in_comment = False
+            i = end + 2
+        elif line.startswith("/*", i):
+            in_comment = True
+            i += 2
+        elif line.startswith("//", i):
+            break
+        elif line[i] in "\"'":
+            quote = line[i]
+            i += 1
+            while i < len(line) and line[i] != quote:
+                i += 2 if line[i] == "\\" else 1
+            i += 1
+        else:
+            out.append(line[i])
+            i += 1
+    return "".join(out), in_comment
+
+
+def _definition_name(header: str, last_line: str) -> str:
+    """
+    Returns the name of the function, struct/union/enum or typedef defined by a top-level block,
+    given the code before its opening brace and its last line.
+    """
+    header = header.split("{", 1)[0]
+    if "(" in header:
+        names = _FUNCTION_NAME_RE.findall(header)
+        return names[-1] if names else ""
+    # typedef struct { ... } js_Name;
+    typedef = _TYPEDEF_NAME_RE.search(last_line)
+    if header.lstrip().startswith("typedef") and typedef:
+        return typedef.group(1)
+    names = _TYPE_NAME_RE.findall(header)
+    return names[-1] if names else ""
+
+
+def split_c_definitions(lines: list[str]) -> list[tuple[int, int, str]]:
+    """
+    Splits C source lines on the top-level definitions (functions, structs, initialized tables).
+    The code between two definitions (includes, macros, prototypes) and the comments before a definition
+    stay with the following definition.
+
+    Args:
+        lines (list[str]): The lines of the file.
+
+    Returns:
+        list: (first line, last line, definition name) of each segment, with 0-based, inclusive line numbers.
+            The name is empty for segments without a definition.
+    """
+    segments = []
+    start = 0
+    depth = 0
+    in_comment = False
+    in_macro = False
+    header = []
+
+    for i, line in enumerate(lines):
+        code, in_comment = _strip_literals(line, in_comment)
+
+        # preprocessor lines (and their continuations) are not part of the definitions
+        if in_macro or (depth == 0 and code.lstrip().startswith("#")):
+            in_macro = line.rstrip().endswith("\\")
+            continue
+
+        if depth == 0:
+            header.append(code)
+        depth += code.count("{") - code.count("}")
+        depth = max(depth, 0)
+
+        if depth == 0:
+            stripped = code.rstrip()
+            # a definition ends when its braces are closed (and a declaration like `} table[] = {...};` is complete)
+            if "}" in code and stripped.endswith(("}", ";")):
+                segments.append((start, i, _definition_name(" ".join(header), code)))
+                start = i + 1
+                header = []
+            elif stripped.endswith(";"):
+                # a prototype or declaration: the header of the next definition starts after it
+                header = []
+
+    if start < len(lines):
+        segments.append((start, len(lines) - 1, ""))
+    return segments
+
+
+def _definition_start(lines: list[str], first: int, last: int, name: str) -> int:
+    """Returns the first line of the signature of a definition, skipping the comments and code before it."""
+    # the opening brace of the definition
+    in_comment = False
+    brace_line = last
+    for i in range(first, last + 1):
+        code, in_comment = _strip_literals(lines[i], in_comment)
+        if "{" in code:
+            brace_line = i
+            break
+
+    # the line with the name, and the return type on the line before (`static int\nhelper(...)`)
+    name_re = re.compile(rf"\b{re.escape(name)}\b")
+    start = brace_line
+    for i in range(brace_line, first - 1, -1):
+        if name_re.search(lines[i]):
+            start = i
+            break
+    previous = lines[start - 1].strip() if start > first else ""
+    if previous and not previous.endswith((";", "}", "*/")) and not previous.startswith(("#", "/", "*")):
+        start -= 1
+    return start
+
+
+def extract_symbols(path: str, content: str) -> list[dict]:
+    """
+    Extracts the symbols defined in a C source: functions, structs/unions/enums, typedefs and macros.
+
+    Args:
+        path (str): The path of the file in the repository.
+        content (str): The content of the file.
+
+    Returns:
+        list[dict]: name, kind, file_path, start_line, end_line (1-based), signature and code of each symbol.
+    """
+    lines = content.splitlines()
+    symbols = []
+
+    def _add(name, kind, start, end, signature):
+        symbols.append({
+            "name": name,
+            "kind": kind,
+            "file_path": path,
+            "start_line": start + 1,
+            "end_line": end + 1,
+            "signature": re.sub(r"\s+", " ", signature).strip(),
+            "code": "\n".join(lines[start:end + 1]),
         })
-        d.page_content = f"FILE NAME: {src}\n---\nCONTENT:{d.page_content}"
-
-    # store docs in chroma
-    store = Chroma(
-        collection_name=SEMANTIC_CODE_COLLECTION,
-        embedding_function=embeddings,
-        collection_metadata=CHROMA_METADATA,
-        persist_directory=CHROMA_PERSIST_DIR,
-    )
-    store.reset_collection()
-    store.add_documents(docs)
-    return store
\ No newline at end of file
+
+    for first, last, name in split_c_definitions(lines):
+        if not name:
+            continue
+        start = _definition_start(lines, first, last, name)
+        header = " ".join(lines[start:last + 1]).split("{", 1)[0]
+        if "(" in header:
+            _add(name, "function", start, last, header)
+            continue
+
+        tag = _TYPE_NAME_RE.search(header)
+        if header.lstrip().startswith("typedef"):
+            # typedef struct [tag] { ... } js_Name;
+            _add(name, "typedef", start, last, f"{header.strip()} {{ ... }} {name}")
+            if tag and tag.group(1) != name:
+                _add(tag.group(1), tag.group(0).split()[0], start, last, tag.group(0))
+        elif tag:
+            _add(name, tag.group(0).split()[0], start, last, header)
+
+    for i, line in enumerate(lines):
+        # #define NAME(args) ..., with the continuation lines
+        macro = re.match(r"\s*#\s*define\s+(\w+)", line)
+        if macro:
+            end = i
+            while lines[end].rstrip().endswith("\\") and end + 1 < len(lines):
+                end += 1
+            _add(macro.group(1), "macro", i, end, line.rstrip("\\ "))
+            continue
+
+        # typedef struct js_Name js_Name;
+        typedef = re.match(r"typedef\b[^{;]*?(\w+)\s*;\s*$", line)
+        if typedef:
+            _add(typedef.group(1), "typedef", i, i, line)
+
+    return symbols
+
+
+def chunk_lines(lines: list[str], segments: list[tuple[int, int, str]], max_lines: int = CODE_CHUNK_MAX_LINES,
+                overlap: int = CODE_CHUNK_OVERLAP) -> list[tuple[int, int, str]]:
+    """
+    Builds the chunks of a file from its segments: one chunk per segment, and segments longer than `max_lines`
+    (e.g. the interpreter loop) split in windows.
+    Each chunk also starts with the last `overlap` lines of the previous one, for context.
+
+    Returns:
+        list: (first line, last line, definition name) of each chunk, 0-based and inclusive.
+    """
+    chunks = []
+    for first, last, name in segments:
+        # skip segments made only of blank lines
+        if not any(line.strip() for line in lines[first:last + 1]):
+            continue
+
+        first = max(0, first - overlap)
+        step = max(1, max_lines - overlap)
+        for window in range(first, last + 1, step):
+            chunks.append((window, min(window + max_lines - 1, last), name))
+            if window + max_lines - 1 >= last:
+                break
+    return chunks
+
+
+def chunk_file(path: str, content: str) -> list[tuple[int, int, str]]:
+    """
+    Chunks a file of the code index: C sources on their top-level definitions, the other files in windows of lines.
+
+    Returns:
+        list: (first line, last line, definition name) of each chunk, 0-based and inclusive.
+    """
+    lines = content.splitlines()
+    if path.endswith(_C_EXTENSIONS):
+        segments = split_c_definitions(lines)
+    else:
+        segments = [(0, len(lines) - 1, "")] if lines else []
+    return chunk_lines(lines, segments)
+
+
+def _file_documents(path: str, content: str, blob_sha: str) -> tuple[list[Document], list[str]]:
+    """Builds the chunk documents of a file and their ids."""
+    full_name = os.path.basename(path)
+    stem = Path(full_name).stem.lower()
+    ext = Path(full_name).suffix.lower()
+    lines = content.splitlines()
+
+    docs, ids = [], []
+    for chunk_index, (first, last, name) in enumerate(chunk_file(path, content)):
+        header = f"FILE NAME: {path}\nLINES: {first + 1}-{last + 1}\n"
+        if name:
+            header += f"DEFINES: {name}\n"
+        docs.append(Document(
+            page_content=f"{header}---\nCONTENT:" + "\n".join(lines[first:last + 1]),
+            metadata={
+                "source": path,
+                "file_path": path,
+                "path": path,               # original path if available
+                "file_name": full_name,     # e.g., "opnames.h"
+                "stem": stem,               # e.g., "opnames"
+                "ext": ext,                 # e.g., ".h"
+                "function_name": name,      # e.g., "js_pushstring", "" if the chunk has no definition
+                "start_line": first + 1,
+                "end_line": last + 1,
+                "chunk_index": chunk_index,
+                "blob_sha": blob_sha,       # git blob of the file, to detect changes
+            },
+        ))
+        ids.append(f"{path}:{chunk_index}")
+    return docs, ids
+
+
+def build_mujs_code_index():
+    """
+    Updates the code index of the MuJS branch: C sources are indexed per function, the other files in chunks of lines.
+    Only the files whose git blob changed since the last build (or whose chunks are incomplete, after an interrupted
+    build) are re-embedded, the chunks of the deleted files are removed.
+    The `symbols` table (functions, structs, typedefs and macros) is rebuilt alongside.
+    """
+    repo = Repo(MUJS_ABSOLUTE_PATH)
+    blobs = {
+        item.path: item
+        for item in repo.commit(MUJS_BRANCH).tree.traverse()
+        if item.type == "blob" and _is_indexed_file(item.path)
+    }
+
+    store = get_collection(SEMANTIC_CODE_COLLECTION)
+    indexed = store.get(include=["metadatas"])
+
+    # blobs of the chunks of each indexed file, and their ids
+    indexed_blobs, indexed_ids = {}, {}
+    for doc_id, metadata in zip(indexed["ids"], indexed["metadatas"]):
+        if not metadata or "blob_sha" not in metadata:
+            # index built before chunking: rebuild it from scratch
+            store.reset_collection()
+            get_lexical_index().clear(SEMANTIC_CODE_COLLECTION)
+            indexed_blobs, indexed_ids = {}, {}
+            break
+        indexed_blobs.setdefault(metadata["path"], set()).add(metadata["blob_sha"])
+        indexed_ids.setdefault(metadata["path"], []).append(doc_id)
+
+    contents = {path: blob.data_stream.read().decode("utf-8", errors="replace") for path, blob in blobs.items()}
+
+    # a file is unchanged only if all its chunks are of the current blob and none is missing,
+    # so that the files left half-indexed by an interrupted build are indexed again
+    changed = [
+        path for path, blob in blobs.items()
+        if indexed_blobs.get(path) != {blob.hexsha}
+        or len(indexed_ids[path]) != len(chunk_file(path, contents[path]))
+    ]
+    removed = [path for path in indexed_blobs if path not in blobs]
+
+    docs, ids = [], []
+    for path in changed:
+        file_docs, file_ids = _file_documents(path, contents[path], blobs[path].hexsha)
+        docs.extend(file_docs)
+        ids.extend(file_ids)
+
+    # store docs in chroma (the chunks with the same id replace the old ones)
+    for i in range(0, len(docs), 500):
+        store.add_documents(docs[i:i + 500], ids=ids[i:i + 500])
+    get_lexical_index().add(SEMANTIC_CODE_COLLECTION, docs, ids)
+
+    # then remove the old chunks left over by the changed files, and the chunks of the deleted files
+    new_ids = set(ids)
+    stale_ids = [doc_id for path in changed + removed for doc_id in indexed_ids.get(path, [])
+                 if doc_id not in new_ids]
+    if stale_ids:
+        store.delete(ids=stale_ids)
+        get_lexical_index().delete(SEMANTIC_CODE_COLLECTION, stale_ids)
+
+    print(f"Code index: {len(changed)} files re-indexed ({len(docs)} chunks), {len(removed)} removed, "
+          f"{len(blobs) - len(changed)} unchanged")
+
+    # the symbol table is cheap to extract (no embeddings), so it is always rebuilt from all the sources
+    symbols = [symbol for path, content in contents.items() if path.endswith(_C_EXTENSIONS)
+               for symbol in extract_symbols(path, content)]
+    save_symbols(symbols)
+    print(f"Symbol table: {len(symbols)} symbols")
+    return store
@@ -0,0 +1,56 @@
+import sqlite3
+import threading
+
+from utils.config import SQL_PERSIST_DIR, SQLITE_CACHE_SIZE_KB
+
+# One connection per (thread, database): sqlite3 connections must not be shared between threads
+_local = threading.local()
+
+
+class _ThreadConnections(dict):
+    """
+    The connections of a thread, by database path. They are closed when the thread exits and its thread-local
+    data is released, so the threads of a pool don't leave their connections open.
+    """
+
+    def __del__(self):
+        for conn in self.values():
+            conn.close()
+
+
+def get_connection(db_path: str = SQL_PERSIST_DIR) -> sqlite3.Connection:
+    """
+    Returns the persistent connection of the current thread to a SQLite database, opening it on first use.
+    The connection uses WAL journal mode, so readers don't block the writer, and synchronous=NORMAL,
+    so commits don't pay a full fsync each time.
+
+    Args:
+        db_path (str): The path of the SQLite database.
+
+    Returns:
+        sqlite3.Connection: The connection. It must not be closed by the caller.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = _ThreadConnections()
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        connections[db_path] = conn
+
+    return conn
+
+
+def close_connections() -> None:
+    """
+    Closes the connections opened by the current thread.
+    """
+    connections = getattr(_local, "connections", {})
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
@@ -1,42 +1,231 @@
 import json
-import sqlite3
+import os
 from datetime import datetime
 
 from utils.config import SQL_PERSIST_DIR, OFFLINE_PIPELINE_TEST_NAME
 from utils.entities import Summary, Commit, DetailedRq1QuantitativeResults, QuestionAnswer, \
     DetailedRq2QuantitativeResults
 from utils.logging_handler import SQLiteHandler
+from utils.sqlite_connection import get_connection
 
 db_handler = SQLiteHandler(SQL_PERSIST_DIR)
 
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'db_sqllite', 'sqllite_init.sql')
+
+
+def diffs_to_text(diffs: dict) -> str:
+    """
+    Joins the diffs of the files of a commit as plain text, for the full-text index.
+    """
+    return "\n".join(diffs.values())
+
 
 def save_commits_to_sqlite(commits):
     """
-    Save a list of commits to the SQLite database.
+    Save a list of commits to the SQLite database, with their changed files in the `commit_files` table.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
-    # Bulk insert of commits into the database
-    cursor.executemany(
-        """
-        INSERT OR IGNORE INTO commits (commit_hash, author, date, message, files, diffs)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, [
-            (
+    for commit in commits.values():
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO commits (commit_hash, author, date, message, files, diffs, diffs_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
                 commit.get("hash", ""),
                 commit.get("author", ""),
                 commit.get("date", "").strftime('%Y-%m-%d %H:%M:%S') if isinstance(commit.get("date"), datetime)
                 else commit.get("date", ""),
                 commit.get("message", ""),
                 json.dumps(commit['files']),
-                json.dumps(commit['diffs'])
+                json.dumps(commit['diffs']),
+                diffs_to_text(commit['diffs'])
+            ))
+
+        # files are saved only for new commits, the ignored ones already have them
+        if cursor.rowcount == 1:
+            save_commit_files(cursor, cursor.lastrowid, commit['diffs'])
+
+    conn.commit()
+
+
+def save_commit_files(cursor, commit_id, diffs):
+    """
+    Save the files changed by a commit in the `commit_files` table.
+    For renamed files (`old -> new`) the new path is saved.
+    """
+    cursor.executemany(
+        """
+        INSERT INTO commit_files (commit_id, path, lines_added, lines_removed, diff_text)
+        VALUES (?, ?, ?, ?, ?)
+        """, [
+            (
+                commit_id,
+                file_name.split(" -> ")[-1],
+                sum(1 for line in diff.splitlines() if line.startswith('+')),
+                sum(1 for line in diff.splitlines() if line.startswith('-')),
+                diff
             )
-            for commit in commits.values()
+            for file_name, diff in diffs.items()
         ])
 
+
+def upgrade_schema():
+    """
+    Apply the schema to the database, adding the columns introduced after its creation,
+    and index in `commits_fts` the commits saved before the creation of the full-text index.
+    """
+    conn = get_connection(db_handler.db_path)
+    cursor = conn.cursor()
+
+    commits_columns = {row[1] for row in cursor.execute("PRAGMA table_info(commits)")}
+    if commits_columns and "diffs_text" not in commits_columns:
+        # the full-text index of the JSON-encoded diffs is replaced by the one of the decoded diffs
+        cursor.executescript("""
+            DROP TRIGGER IF EXISTS commits_fts_insert;
+            DROP TRIGGER IF EXISTS commits_fts_delete;
+            DROP TRIGGER IF EXISTS commits_fts_update;
+            DROP TABLE IF EXISTS commits_fts;
+            ALTER TABLE commits ADD COLUMN diffs_text TEXT;
+        """)
+        rows = cursor.execute("SELECT id, diffs FROM commits").fetchall()
+        cursor.executemany("UPDATE commits SET diffs_text = ? WHERE id = ?",
+                           [(diffs_to_text(json.loads(diffs)), commit_id) for commit_id, diffs in rows])
+
+    # the NOCASE index on commit_files.path can't be used by the `path = '...'` lookups: recreated by the schema
+    path_index = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_commit_files_path'").fetchone()
+    if path_index and "NOCASE" in path_index[0]:
+        cursor.execute("DROP INDEX idx_commit_files_path")
+
+    summaries_columns = {row[1] for row in cursor.execute("PRAGMA table_info(summaries)")}
+    if summaries_columns and "llama_tech_summary_stats" not in summaries_columns:
+        cursor.execute("ALTER TABLE summaries ADD COLUMN llama_tech_summary_stats TEXT")
+    conn.commit()
+
+    with open(SCHEMA_PATH, encoding="utf-8") as file:
+        cursor.executescript(file.read())
+
+    # one row per indexed commit in the docsize table of the index
+    indexed = cursor.execute("SELECT COUNT(*) FROM commits_fts_docsize").fetchone()[0]
+    saved = cursor.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+    if indexed != saved:
+        cursor.execute("INSERT INTO commits_fts (commits_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def backfill_commit_files():
+    """
+    Populate the `commit_files` table for the commits saved before its creation.
+    """
+    conn = get_connection(db_handler.db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+                   SELECT id, diffs
+                   FROM commits
+                   WHERE NOT EXISTS (SELECT 1 FROM commit_files WHERE commit_files.commit_id = commits.id)
+                   """)
+    rows = cursor.fetchall()
+
+    for commit_id, diffs in rows:
+        save_commit_files(cursor, commit_id, json.loads(diffs))
+
+    conn.commit()
+
+
+def retrieve_last_summarized_commit() -> tuple[int, str] | None:
+    """
+    Retrieve the newest commit that has a summary in the SQLite database.
+    The commits are saved before being summarized, so the newest saved commit may not be processed yet
+    (e.g. if the previous run crashed).
+
+    Returns:
+        tuple[int, str] | None: The id and hash of the last summarized commit, or None if there are no summaries.
+    """
+    conn = get_connection(db_handler.db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+                   SELECT commits.id, commits.commit_hash
+                   FROM commits
+                   JOIN summaries ON summaries.commit_id = commits.id
+                   ORDER BY commits.id DESC
+                   LIMIT 1
+                   """)
+    row = cursor.fetchone()
+
+    return (row[0], row[1]) if row else None
+
+
+def count_commits() -> int:
+    """
+    Count the commits saved in the SQLite database.
+    """
+    conn = get_connection(db_handler.db_path)
+    return conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+
+def retrieve_commit_ids(hashes: list[str]) -> dict[str, int]:
+    """
+    Retrieve the ids of the commits with the given hashes.
+
+    Returns:
+        dict[str, int]: The id of each hash found in the `commits` table.
+    """
+    conn = get_connection(db_handler.db_path)
+    cursor = conn.cursor()
+
+    ids = {}
+    # bounded number of parameters per query
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        cursor.execute(f"SELECT commit_hash, id FROM commits WHERE commit_hash IN ({','.join('?' * len(batch))})",
+                       batch)
+        ids.update(cursor.fetchall())
+    return ids
+
+
+def save_symbols(symbols: list[dict]):
+    """
+    Replace the content of the `symbols` table with the symbols of the current code index.
+    """
+    conn = get_connection(db_handler.db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("DELETE FROM symbols")
+    cursor.executemany(
+        """
+        INSERT INTO symbols (name, kind, file_path, start_line, end_line, signature, code)
+        VALUES (:name, :kind, :file_path, :start_line, :end_line, :signature, :code)
+        """, symbols)
+
     conn.commit()
-    conn.close()
+
+
+def retrieve_symbols(names: list[str]) -> list[dict]:
+    """
+    Retrieve the definitions of the symbols with the given names.
+
+    Returns:
+        list[dict]: The symbols found, with their file, line range, signature and code.
+    """
+    if not names:
+        return []
+
+    conn = get_connection(db_handler.db_path)
+    cursor = conn.cursor()
+
+    cursor.execute(
+        f"""
+        SELECT name, kind, file_path, start_line, end_line, signature, code
+        FROM symbols
+        WHERE name IN ({','.join('?' * len(names))})
+        ORDER BY name, kind, file_path
+        """, names)
+
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 
 def save_summaries_to_sqlite(
@@ -47,12 +236,13 @@ def save_summaries_to_sqlite(
         llama_summary,
         llama_summary_retrieved_docs,
         llama_tech_summary,
-        llama_tech_summary_retrieved_docs
+        llama_tech_summary_retrieved_docs,
+        llama_tech_summary_stats=None
 ):
     """
-    Save a summary to the SQLite database.
+    Save a summary to the SQLite database, with the stats of the technical QA loop if available.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     # Insert summary of a commit into the database
@@ -62,8 +252,8 @@ def save_summaries_to_sqlite(
                                llama_summary_retrieved_docs, llama_summary_retrieved_docs_count,
                                llama_summary_retrieved_docs_scores, llama_tech_summary,
                                llama_tech_summary_retrieved_docs, llama_tech_summary_retrieved_docs_count,
-                               llama_tech_summary_retrieved_docs_scores)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                               llama_tech_summary_retrieved_docs_scores, llama_tech_summary_stats)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         (
             commit_id,
@@ -77,12 +267,12 @@ def save_summaries_to_sqlite(
             llama_tech_summary,
             json.dumps(serialize_docs(llama_tech_summary_retrieved_docs)),
             len(llama_tech_summary_retrieved_docs),
-            json.dumps([score for _, score in llama_tech_summary_retrieved_docs])
+            json.dumps([score for _, score in llama_tech_summary_retrieved_docs]),
+            json.dumps(llama_tech_summary_stats) if llama_tech_summary_stats else None
         )
     )
 
     conn.commit()
-    conn.close()
 
 
 def serialize_docs(docs):
@@ -94,13 +284,12 @@ def delete_all_summaries():
     """
     Delete all summaries from the SQLite database and reset autoincrement ID.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute("DELETE FROM summaries")
     cursor.execute("DELETE FROM sqlite_sequence WHERE name='summaries'")
     conn.commit()
-    conn.close()
 
 
 def retrieve_all_summaries_to_be_validated() -> list[Summary]:
@@ -110,7 +299,7 @@ def retrieve_all_summaries_to_be_validated() -> list[Summary]:
     Returns:
         list[Summary]: A list of Summary objects containing commit details, its summaries and related information.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute("SELECT * FROM summaries WHERE id >= 481 and id < 581")
@@ -136,7 +325,6 @@ def retrieve_all_summaries_to_be_validated() -> list[Summary]:
         )
         summaries.append(summary)
 
-    conn.close()
     return summaries
 
 
@@ -147,7 +335,7 @@ def retrieve_all_commits_to_be_validated() -> list[Commit]:
     Returns:
         list[dict]: A list of dictionaries containing commit details.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute("SELECT * FROM commits WHERE id >= 481 and id < 581")
@@ -167,7 +355,6 @@ def retrieve_all_commits_to_be_validated() -> list[Commit]:
         )
         commits.append(commit)
 
-    conn.close()
     return commits
 
 
@@ -175,7 +362,7 @@ def save_r1_quantitative_results(quantitative_results: list[DetailedRq1Quantitat
     """
     Save a list of quantitative results to the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     # Bulk insert of evaluations into the database
@@ -203,14 +390,13 @@ def save_r1_quantitative_results(quantitative_results: list[DetailedRq1Quantitat
                        ])
 
     conn.commit()
-    conn.close()
 
 
 def save_rq1_g_evals(evaluation_list) -> None:
     """
     Save a list of evaluations to the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     # Bulk insert of evaluations into the database
@@ -242,14 +428,13 @@ def save_rq1_g_evals(evaluation_list) -> None:
                        ])
 
     conn.commit()
-    conn.close()
 
 
 def retrieve_all_rq1_golden_standard() -> list[dict]:
     """
     Retrieve the golden standard for RQ1 from the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute("SELECT * FROM rq1_golden_standard")
@@ -265,7 +450,6 @@ def retrieve_all_rq1_golden_standard() -> list[dict]:
             "technical": row[3],
         })
 
-    conn.close()
     return golden_standard
 
 
@@ -273,7 +457,7 @@ def retrieve_all_rq2_questions_answers() -> list[QuestionAnswer]:
     """
     Retrieve all RQ2 questions and answers from the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -310,7 +494,6 @@ def retrieve_all_rq2_questions_answers() -> list[QuestionAnswer]:
         )
         questions_answers.append(question_answer)
 
-    conn.close()
     return questions_answers
 
 
@@ -318,7 +501,7 @@ def save_rq2_answer(question_id: int, answer: str) -> None:
     """
     Save an RQ2 answer to the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute(
@@ -327,7 +510,6 @@ def save_rq2_answer(question_id: int, answer: str) -> None:
     )
 
     conn.commit()
-    conn.close()
 
 
 def save_rq2_qualitative_result(question_id: int, answer_id: int, evaluation_type: str, accuracy: int,
@@ -336,7 +518,7 @@ def save_rq2_qualitative_result(question_id: int, answer_id: int, evaluation_typ
     """
     Save an RQ2 qualitative result to the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -359,14 +541,13 @@ def save_rq2_qualitative_result(question_id: int, answer_id: int, evaluation_typ
                    )
 
     conn.commit()
-    conn.close()
 
 
 def save_rq2_g_evals(evaluation_list) -> None:
     """
     Save a list of RQ2 G-Eval evaluations to the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     # Bulk insert of evaluations into the database
@@ -392,14 +573,13 @@ def save_rq2_g_evals(evaluation_list) -> None:
                        ])
 
     conn.commit()
-    conn.close()
 
 
 def save_r2_quantitative_results(detailed_results: list[DetailedRq2QuantitativeResults]) -> None:
     """
     Save a list of RQ2 quantitative results to the SQLite database.
     """
-    conn = sqlite3.connect(db_handler.db_path)
+    conn = get_connection(db_handler.db_path)
     cursor = conn.cursor()
 
     # Bulk insert of evaluations into the database
@@ -427,4 +607,3 @@ def save_r2_quantitative_results(detailed_results: list[DetailedRq2QuantitativeR
                        ])
 
     conn.commit()
-    conn.close()